@@ -0,0 +1,106 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database, created the same way as
+for ``manage.py test``, so they never touch the development database.
+"""
+import contextlib
+import io
+import logging
+import os
+import random
+import tempfile
+import time
+
+
+def setup_django():
+    """Configure Django for a standalone benchmark script."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    # Benchmarks send requests from one address as fast as they can, which
+    # the rate limits of polls/ratelimit.py would reject.
+    os.environ.setdefault('POLLS_VOTE_BURST', str(10 ** 9))
+    os.environ.setdefault('POLLS_LOGIN_BURST', str(10 ** 9))
+    import django
+    django.setup()
+    # Request logging would dominate the timings. Disabling the level,
+    # rather than setting logger levels, survives the logging being
+    # configured again when the WSGI and ASGI applications are loaded.
+    logging.disable(logging.INFO)
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Create a test database for the duration of the block. SQLite databases
+    are kept in a temporary file rather than in memory, so that background
+    threads wait for locks instead of failing.
+    """
+    from django.db import connection
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextlib.contextmanager
+def stopwatch():
+    """Yield a dict whose 'seconds' is set to the block's duration."""
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
+
+
+def seed(num_users, num_questions, num_choices, num_votes=0, rng=None):
+    """
+    Create users, open questions with their choices, and up to `num_votes`
+    votes by random users. Return the users and a dict mapping each question
+    id to the ids of its choices.
+    """
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from polls.models import Choice, Question, Vote
+
+    users = User.objects.bulk_create(
+        User(username=f'bench{i}') for i in range(num_users))
+    questions = Question.objects.bulk_create(
+        Question(question_text=f'Question {i}') for i in range(num_questions))
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f'Choice {i}')
+        for question in questions for i in range(num_choices))
+    choices = {}
+    for choice in Choice.objects.all():
+        choices.setdefault(choice.question_id, []).append(choice.pk)
+
+    if num_votes:
+        rng = rng or random.Random(0)
+        ballots = {}
+        for _ in range(num_votes):
+            key = (rng.choice(users).pk, rng.choice(questions).pk)
+            ballots[key] = rng.choice(choices[key[1]])
+        Vote.objects.bulk_create(
+            (Vote(user_id=user_id, question_id=question_id, choice_id=choice_id)
+             for (user_id, question_id), choice_id in ballots.items()),
+            batch_size=5000)
+        call_command('rebuild_vote_counts', stdout=io.StringIO())
+    return users, choices
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at `fraction` (0..1) of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
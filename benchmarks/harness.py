@@ -0,0 +1,211 @@
+"""
+Ways of sending requests to the project in-process.
+
+Each driver takes a list of (session, method, path, data) requests and
+sends them from `concurrency` workers, returning the elapsed seconds, the
+latency of each request and the number of 5xx responses.
+
+- ``client`` uses django.test.Client, as the functional tests do.
+- ``wsgi`` calls mysite.wsgi.application with WSGI environs.
+- ``asgi`` calls mysite.asgi.application with ASGI scopes on one event loop.
+
+A session is a logged-in user's (session cookie, CSRF token) pair, so the
+WSGI and ASGI drivers pass the same middleware as a browser would.
+"""
+import asyncio
+import io
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+
+def login(user):
+    """Return a (session id, CSRF token) pair for `user`."""
+    from django.conf import settings
+    from django.middleware.csrf import _get_new_csrf_string
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    return (client.cookies[settings.SESSION_COOKIE_NAME].value,
+            _get_new_csrf_string())
+
+
+def cookie_header(session):
+    from django.conf import settings
+
+    session_id, csrf_token = session
+    return (f'{settings.SESSION_COOKIE_NAME}={session_id}; '
+            f'{settings.CSRF_COOKIE_NAME}={csrf_token}')
+
+
+def encode_body(data):
+    return urlencode(data).encode() if data else b''
+
+
+def _split(requests, concurrency):
+    return [requests[number::concurrency] for number in range(concurrency)]
+
+
+def _run_threads(worker, requests, concurrency):
+    from django.db import connection
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(batch):
+        timings, failed = worker(batch)
+        with lock:
+            latencies.extend(timings)
+            errors.append(failed)
+        connection.close()
+
+    threads = [threading.Thread(target=run, args=(batch,))
+               for batch in _split(requests, concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, sum(errors)
+
+
+def run_client(requests, concurrency=1):
+    """Send `requests` through django.test.Client."""
+    from django.conf import settings
+    from django.test import Client
+
+    def worker(batch):
+        client = Client(raise_request_exception=False)
+        timings = []
+        failed = 0
+        for (session_id, _), method, path, data in batch:
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_id
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            timings.append(time.perf_counter() - start)
+            failed += response.status_code >= 500
+        return timings, failed
+
+    return _run_threads(worker, requests, concurrency)
+
+
+def run_wsgi(requests, concurrency=1):
+    """Send `requests` to the WSGI application from threads."""
+    from mysite.wsgi import application
+
+    def call(session, method, path, data):
+        body = encode_body(data)
+        environ = {
+            'REQUEST_METHOD': method.upper(),
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': cookie_header(session),
+            'HTTP_X_CSRFTOKEN': session[1],
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        result = application(
+            environ, lambda line, headers, exc_info=None: status.append(line))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split()[0])
+
+    def worker(batch):
+        timings = []
+        failed = 0
+        for session, method, path, data in batch:
+            start = time.perf_counter()
+            failed += call(session, method, path, data) >= 500
+            timings.append(time.perf_counter() - start)
+        return timings, failed
+
+    return _run_threads(worker, requests, concurrency)
+
+
+def run_asgi(requests, concurrency=1):
+    """Send `requests` to the ASGI application from coroutines."""
+    from mysite.asgi import application
+
+    async def call(session, method, path, data):
+        body = encode_body(data)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', cookie_header(session).encode()),
+                (b'x-csrftoken', session[1].encode()),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected until the response is sent.
+            return await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await application(scope, receive, send)
+        return status[0]
+
+    latencies = []
+    errors = []
+
+    async def worker(batch):
+        for session, method, path, data in batch:
+            start = time.perf_counter()
+            if await call(session, method, path, data) >= 500:
+                errors.append(path)
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(batch)
+                               for batch in _split(requests, concurrency)))
+        return time.perf_counter() - start
+
+    return asyncio.run(main()), latencies, len(errors)
+
+
+DRIVERS = {
+    'client': run_client,
+    'wsgi': run_wsgi,
+    'asgi': run_asgi,
+}
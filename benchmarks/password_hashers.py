@@ -0,0 +1,63 @@
+"""
+Report logins/sec per core for each password hasher at the configured cost.
+
+Each login runs authenticate() for a user whose password was hashed with
+the hasher under test, in one thread, so the rate is what one core can do.
+Costs come from the PASSWORD_* settings, so they can be tuned from the
+environment. Run from the project directory:
+
+    python -m benchmarks.password_hashers --logins 20
+    PASSWORD_PBKDF2_ITERATIONS=600000 python -m benchmarks.password_hashers
+"""
+import argparse
+
+from benchmarks.common import setup_django, stopwatch, test_database
+
+
+def run(hasher, num_logins):
+    """Log in `num_logins` times with `hasher` and return logins/sec."""
+    from django.conf import settings
+    from django.contrib.auth import authenticate
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+
+    others = [path for path in settings.PASSWORD_HASHERS if path != hasher]
+    with override_settings(PASSWORD_HASHERS=[hasher, *others]):
+        User.objects.create_user(username='bench', password='benchmark')
+        try:
+            with stopwatch() as elapsed:
+                for _ in range(num_logins):
+                    if authenticate(username='bench',
+                                    password='benchmark') is None:
+                        raise RuntimeError(f"Login failed with {hasher}")
+        finally:
+            User.objects.filter(username='bench').delete()
+    return num_logins / elapsed['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--logins', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+
+    with test_database():
+        for hasher in settings.PASSWORD_HASHERS:
+            name = hasher.rsplit('.', 1)[1]
+            instance = import_string(hasher)()
+            if getattr(instance, 'library', None):
+                try:
+                    instance._load_library()
+                except ValueError as error:
+                    print(f"{name:>22}: skipped, {error}")
+                    continue
+            rate = run(hasher, args.logins)
+            print(f"{name:>22}: {rate:8.1f} logins/sec  "
+                  f"{1000 / rate:8.1f} ms each")
+
+
+if __name__ == '__main__':
+    main()
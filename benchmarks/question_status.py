@@ -0,0 +1,95 @@
+"""
+Time listing questions with their open/closed status.
+
+Compares calling can_vote() on every row, sharing one `now` across the rows,
+and computing the status in SQL with Question.objects.with_status(). The
+status costs little next to loading the rows, so these three take about the
+same time; with_status() keeps the status consistent with open() and
+closed(), it does not make listings faster. The last two cases fetch only
+the open questions, filtered in Python or in SQL. Filtering in SQL is
+faster, since the closed questions are never loaded.
+Run from the project directory:
+
+    python -m benchmarks.question_status --questions 10000
+"""
+import argparse
+import datetime
+import random
+
+from benchmarks.common import setup_django, stopwatch, test_database
+
+
+def seed(num_questions, rng):
+    from django.utils import timezone
+    from polls.models import Question
+
+    now = timezone.now()
+    questions = []
+    for i in range(num_questions):
+        pub_date = now - datetime.timedelta(days=rng.uniform(-5, 30))
+        end_date = (pub_date + datetime.timedelta(days=rng.uniform(1, 20))
+                    if rng.random() < 0.7 else None)
+        questions.append(Question(question_text=f'Question {i}',
+                                  pub_date=pub_date, end_date=end_date))
+    Question.objects.bulk_create(questions, batch_size=1000)
+
+
+def per_row():
+    from polls.models import Question
+
+    return [question.can_vote() for question in Question.objects.all()]
+
+
+def shared_now():
+    from django.utils import timezone
+    from polls.models import Question
+
+    now = timezone.now()
+    return [question.can_vote(now) for question in Question.objects.all()]
+
+
+def in_sql():
+    from polls.models import Question
+
+    return [question.is_open for question in Question.objects.with_status()]
+
+
+def open_in_python():
+    from django.utils import timezone
+    from polls.models import Question
+
+    now = timezone.now()
+    return [question for question in Question.objects.all()
+            if question.can_vote(now)]
+
+
+def open_in_sql():
+    from polls.models import Question
+
+    return list(Question.objects.open())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        seed(args.questions, random.Random(0))
+        for name, listing in (('per row', per_row), ('shared now', shared_now),
+                              ('in sql', in_sql),
+                              ('open, python', open_in_python),
+                              ('open, sql', open_in_sql)):
+            timings = []
+            for _ in range(args.repeat):
+                with stopwatch() as elapsed:
+                    listing()
+                timings.append(elapsed['seconds'])
+            print(f"{name:>12}: {1000 * min(timings):8.1f} ms "
+                  f"per {args.questions} questions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Count the database writes of a vote for each session engine and message
+storage.
+
+Each vote is a POST to the vote view followed by the GET of the results
+page it redirects to, as a browser would send them. Writes are the INSERT,
+UPDATE and DELETE statements run; session writes are those on the
+django_session table. Run from the project directory:
+
+    python -m benchmarks.session_writes --votes 100
+"""
+import argparse
+import itertools
+
+from benchmarks.common import seed, setup_django, test_database
+
+ENGINES = ['db', 'cached_db', 'signed_cookies']
+STORAGES = ['session', 'cookie']
+
+
+class WriteCounter:
+    """A query wrapper that counts writes, and those on sessions."""
+
+    def __init__(self):
+        self.writes = 0
+        self.session_writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE',
+                                                      'DELETE'):
+            self.writes += 1
+            self.session_writes += 'django_session' in sql
+        return execute(sql, params, many, context)
+
+
+def run(engine, storage, users, choices, num_votes):
+    """Return the writes and session writes per vote."""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from polls.models import Vote
+
+    # Start from no votes, so that each run writes the same votes.
+    Vote.objects.all().delete()
+    cache.clear()
+    with override_settings(
+            SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}',
+            MESSAGE_STORAGE=f'django.contrib.messages.storage.{storage}.'
+                            f'{storage.capitalize()}Storage'):
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        # Every vote is the first of its user in its poll.
+        ballots = list(itertools.islice(
+            itertools.product(clients, choices.items()), num_votes))
+        counter = WriteCounter()
+        with connection.execute_wrapper(counter):
+            for client, (question_id, choice_ids) in ballots:
+                response = client.post(
+                    reverse('polls:vote', args=(question_id,)),
+                    {'choice': choice_ids[0]})
+                client.get(response['Location'])
+        num_votes = len(ballots)
+    return counter.writes / num_votes, counter.session_writes / num_votes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--votes', type=int, default=100)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        users, choices = seed(args.users, 5, 3)
+        for engine in ENGINES:
+            for storage in STORAGES:
+                writes, session_writes = run(engine, storage, users, choices,
+                                             args.votes)
+                print(f"{engine:>14} sessions, {storage:>7} messages: "
+                      f"{writes:5.2f} writes per vote, "
+                      f"{session_writes:5.2f} on sessions")
+
+
+if __name__ == '__main__':
+    main()
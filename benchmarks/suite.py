@@ -0,0 +1,161 @@
+"""
+Benchmark the polls views and compare the numbers with a stored baseline.
+
+Seeds users, questions, choices and votes, then sends index, detail,
+results and vote requests through each driver in benchmarks/harness.py.
+For every driver and view it reports requests/sec, p50/p95/p99 latency and
+queries per request (counted by mysite.metrics). The run fails when a view
+had server errors or ran more queries than in the baseline:
+
+    python -m benchmarks.suite                    # compare with baseline.json
+    python -m benchmarks.suite --compare-timings  # and fail on slowdowns too
+    python -m benchmarks.suite --save-baseline    # record a new baseline
+
+Query counts do not depend on the machine. Timings do, so compare them
+only against a baseline recorded on the machine that runs the comparison.
+"""
+import argparse
+import json
+import pathlib
+import random
+import sys
+
+from benchmarks.common import percentile, seed, setup_django, test_database
+from benchmarks.harness import DRIVERS, login
+
+BASELINE = pathlib.Path(__file__).with_name('baseline.json')
+VIEWS = ['index', 'detail', 'results', 'vote']
+
+
+def requests_for(view, sessions, choices, count, rng):
+    """Return `count` (session, method, path, data) requests for `view`."""
+    from django.urls import reverse
+
+    requests = []
+    for _ in range(count):
+        session = rng.choice(sessions)
+        question_id = rng.choice(list(choices))
+        if view == 'index':
+            requests.append((session, 'get', reverse('polls:index'), None))
+        elif view == 'vote':
+            requests.append((session, 'post',
+                             reverse('polls:vote', args=(question_id,)),
+                             {'choice': rng.choice(choices[question_id])}))
+        else:
+            requests.append((session, 'get',
+                             reverse(f'polls:{view}', args=(question_id,)),
+                             None))
+    return requests
+
+
+def measure(driver, requests, concurrency):
+    """Run `requests` and return their throughput, latency and queries."""
+    from mysite.metrics import registry
+
+    registry.reset()
+    seconds, latencies, errors = DRIVERS[driver](requests, concurrency)
+    latencies.sort()
+    histograms = registry.snapshot()
+    queries = sum(views['queries']['sum'] for views in histograms.values())
+    count = sum(views['queries']['count'] for views in histograms.values())
+    return {
+        'throughput': round(len(latencies) / seconds, 1),
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 2),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 2),
+        'queries': round(queries / count, 2) if count else 0,
+        'errors': errors,
+    }
+
+
+def compare(results, baseline, tolerance=None):
+    """
+    Return a description of each regression of `results` from `baseline`.
+    Timings are only compared when a `tolerance` is given.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['errors']:
+            regressions.append(f"{name}: {result['errors']} server errors")
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: {result['queries']} queries per "
+                               f"request, baseline {base['queries']}")
+        if tolerance is None:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']} req/s, "
+                               f"baseline {base['throughput']}")
+        for key in ('p50_ms', 'p95_ms'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]}, "
+                                   f"baseline {base[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--votes', type=int, default=2000,
+                        help="votes to seed before measuring")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="requests per driver and view")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--drivers', nargs='+', choices=list(DRIVERS),
+                        default=list(DRIVERS))
+    parser.add_argument('--views', nargs='+', choices=VIEWS, default=VIEWS)
+    parser.add_argument('--baseline', type=pathlib.Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="write the results as the new baseline")
+    parser.add_argument('--compare-timings', action='store_true',
+                        help="also fail when a view got slower")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed relative slowdown with "
+                             "--compare-timings (default: 0.5)")
+    args = parser.parse_args()
+
+    setup_django()
+    rng = random.Random(0)
+    results = {}
+    with test_database():
+        users, choices = seed(args.users, args.questions, args.choices,
+                              args.votes, rng)
+        sessions = [login(user) for user in users]
+        for driver in args.drivers:
+            for view in args.views:
+                warmup = requests_for(view, sessions, choices, 10, rng)
+                DRIVERS[driver](warmup, args.concurrency)
+                requests = requests_for(view, sessions, choices,
+                                        args.requests, rng)
+                result = measure(driver, requests, args.concurrency)
+                name = f'{driver}.{view}'
+                results[name] = result
+                print(f"{name:>14}: {result['throughput']:8.1f} req/s  "
+                      f"p50 {result['p50_ms']:7.2f}  "
+                      f"p95 {result['p95_ms']:7.2f}  "
+                      f"p99 {result['p99_ms']:7.2f} ms  "
+                      f"{result['queries']:5.2f} queries  "
+                      f"{result['errors']} errors")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"Saved the baseline to {args.baseline}.")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline.")
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text()),
+                          args.tolerance if args.compare_timings else None)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
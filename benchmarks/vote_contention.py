@@ -0,0 +1,83 @@
+"""
+Measure votes/sec when many threads vote for the same choice at once, for
+several numbers of vote counter shards.
+
+Every vote for a choice used to update the choice's row, so concurrent
+voters queued on its lock. With shards each voter updates the shard picked
+by their user id. Run from the project directory, against SQLite (WAL) or,
+with DATABASE_ENGINE=postgres in the environment, a local Postgres:
+
+    python -m benchmarks.vote_contention --threads 8 --shards 1 4 16
+
+SQLite allows one writer at a time whatever the shard count, so only
+Postgres, which locks rows, is expected to scale with the shards.
+"""
+import argparse
+import threading
+
+from benchmarks.common import seed, setup_django, stopwatch, test_database
+
+
+def run(users, choice_ids, num_threads, votes_per_thread):
+    """Vote from `num_threads` threads at once and return votes/sec."""
+    from django.db import connection
+    from polls.models import Choice, Vote
+
+    choices = list(Choice.objects.filter(pk__in=choice_ids))
+    barrier = threading.Barrier(num_threads + 1)
+    errors = []
+
+    def cast_votes(number):
+        barrier.wait()
+        try:
+            for vote in range(votes_per_thread):
+                user = users[(number * votes_per_thread + vote) % len(users)]
+                Vote.objects.record(user, choices[vote % len(choices)])
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=cast_votes, args=(number,))
+               for number in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    with stopwatch() as elapsed:
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return num_threads * votes_per_thread / elapsed['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--votes', type=int, default=200,
+                        help="votes per thread")
+    parser.add_argument('--choices', type=int, default=2,
+                        help="choices of the one poll everybody votes in")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test import override_settings
+    from polls.models import Vote, VoteCounter
+
+    with test_database():
+        users, choices = seed(args.threads * args.votes, 1, args.choices)
+        [choice_ids] = choices.values()
+        print(f"{connection.vendor}, {args.threads} threads, "
+              f"{args.votes} votes each")
+        for shards in args.shards:
+            Vote.objects.all().delete()
+            VoteCounter.objects.all().delete()
+            with override_settings(POLLS_VOTE_COUNTER_SHARDS=shards):
+                rate = run(users, choice_ids, args.threads, args.votes)
+            print(f"{shards:>3} shards: {rate:8.1f} votes/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare votes/sec of the synchronous vote path with the write-behind queue.
+
+Each vote follows the redirect to the results page, as a browser does, so
+the numbers include what the voter waits for to see their vote.
+
+Run from the project directory:
+
+    python -m benchmarks.vote_ingestion --votes 2000
+"""
+import argparse
+import random
+
+from benchmarks.common import seed, setup_django, stopwatch, test_database
+
+
+def run(mode, clients, choices, num_votes, rng):
+    from django.test import override_settings
+    from django.urls import reverse
+    from polls import ingest
+    from polls.models import Vote
+
+    Vote.objects.all().delete()
+    ingest._vote_queue = None
+    with override_settings(POLLS_VOTE_INGESTION=mode):
+        with stopwatch() as elapsed:
+            for _ in range(num_votes):
+                question_id = rng.choice(list(choices))
+                rng.choice(clients).post(
+                    reverse('polls:vote', args=(question_id,)),
+                    {'choice': rng.choice(choices[question_id])},
+                    follow=True)
+            if mode == 'queue':
+                ingest.get_vote_queue().stop()
+    return num_votes / elapsed['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--votes', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--choices', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+
+    with test_database():
+        users, choices = seed(args.users, args.questions, args.choices)
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        for mode in ('sync', 'queue'):
+            rate = run(mode, clients, choices, args.votes, random.Random(0))
+            print(f"{mode:>5}: {rate:8.1f} votes/sec")
+
+
+if __name__ == '__main__':
+    main()
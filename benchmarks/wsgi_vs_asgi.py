@@ -0,0 +1,120 @@
+"""
+Compare requests/sec and latency of the polls views under WSGI and ASGI.
+
+Each worker is a logged-in user sending a mixed workload: mostly index,
+detail and results pages, and some votes. Under WSGI the workers are
+threads using the synchronous request handler; under ASGI they are
+coroutines on one event loop using the asynchronous handler.
+
+    python -m benchmarks.wsgi_vs_asgi --workers 8 --requests 200
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from benchmarks.common import percentile, seed, setup_django, test_database
+
+VOTE_SHARE = 0.2
+
+
+def workload(choices, num_requests, seed):
+    """Return a list of (method, url, data) requests."""
+    from django.urls import reverse
+
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(num_requests):
+        question_id = rng.choice(list(choices))
+        if rng.random() < VOTE_SHARE:
+            requests.append(('post', reverse('polls:vote', args=(question_id,)),
+                             {'choice': rng.choice(choices[question_id])}))
+        else:
+            name = rng.choice(['polls:index', 'polls:detail', 'polls:results'])
+            args = () if name == 'polls:index' else (question_id,)
+            requests.append(('get', reverse(name, args=args), None))
+    return requests
+
+
+def run_wsgi(users, choices, num_requests):
+    from django.db import connection
+    from django.test import Client
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(number, user):
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        timings = []
+        failed = 0
+        for method, url, data in workload(choices, num_requests, number):
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            timings.append(time.perf_counter() - start)
+            failed += response.status_code >= 500
+        with lock:
+            latencies.extend(timings)
+            errors.append(failed)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(number, user))
+               for number, user in enumerate(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, sum(errors)
+
+
+def run_asgi(users, choices, num_requests):
+    from django.test import AsyncClient
+
+    latencies = []
+    errors = []
+
+    async def worker(number, user):
+        client = AsyncClient(raise_request_exception=False)
+        await client.aforce_login(user)
+        for method, url, data in workload(choices, num_requests, number):
+            start = time.perf_counter()
+            response = await getattr(client, method)(url, data)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors.append(url)
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(number, user)
+                               for number, user in enumerate(users)))
+        return time.perf_counter() - start
+
+    return asyncio.run(main()), latencies, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200,
+                        help="requests per worker")
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--choices', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        users, choices = seed(args.workers, args.questions, args.choices)
+        for name, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+            seconds, latencies, errors = run(users, choices, args.requests)
+            latencies.sort()
+            print(f"{name}: {len(latencies) / seconds:8.1f} req/s  "
+                  f"p50 {percentile(latencies, 0.50) * 1000:6.1f} ms  "
+                  f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  "
+                  f"{errors} errors")
+
+
+if __name__ == '__main__':
+    main()
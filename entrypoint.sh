@@ -1,7 +1,20 @@
 #!/bin/sh
 python ./manage.py migrate
-python ./manage.py loaddata data/polls-v4.json
-python ./manage.py loaddata data/users.json
-python ./manage.py loaddata data/votes-v4.json
+# Skips rows that already exist and rebuilds the vote counters it touches.
+python ./manage.py import_polls data/polls-v4.json data/users.json data/votes-v4.json
 python ./manage.py createsuperuser --username admin --email admin@example.com --noinput
-python ./manage.py runserver 0.0.0.0:8000
+
+# Delete expired sessions every CLEARSESSIONS_INTERVAL seconds (default
+# hourly); signed-cookie sessions are not stored, so they need no cleanup.
+if [ "$SESSION_BACKEND" != "signed_cookies" ]; then
+    (while sleep "${CLEARSESSIONS_INTERVAL:-3600}"; do
+        python ./manage.py clearsessions
+    done) &
+fi
+
+# Set DJANGO_DEV_SERVER=True to use Django's development server instead.
+if [ "$DJANGO_DEV_SERVER" = "True" ]; then
+    exec python ./manage.py runserver 0.0.0.0:8000
+fi
+# exec, so that gunicorn receives SIGTERM and shuts down gracefully.
+exec gunicorn --config gunicorn.conf.py
@@ -0,0 +1,64 @@
+"""
+Gunicorn settings for running KU Polls in production.
+
+SERVER_INTERFACE selects how the app is served: "asgi" (default) runs
+mysite.asgi with Uvicorn workers, "wsgi" runs mysite.wsgi with threaded
+workers. Worker and thread counts are derived from the number of CPUs and
+can be overridden with WEB_CONCURRENCY and GUNICORN_THREADS.
+
+Workers share results versions, cached pages, vote maps and rate limits
+through the cache, so several workers need a cache they all see. With the
+per-process locmem cache, one worker is started, and asking for more is
+an error.
+"""
+import multiprocessing
+import os
+
+from decouple import config
+
+interface = os.getenv('SERVER_INTERFACE', 'asgi')
+shared_cache = config('CACHE_BACKEND', default='locmem') != 'locmem'
+cpus = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+
+if interface == 'wsgi':
+    wsgi_app = 'mysite.wsgi:application'
+    worker_class = 'gthread'
+    # Sync workers spend much of each request waiting on the database.
+    default_workers = cpus * 2 + 1
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+else:
+    wsgi_app = 'mysite.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # An event loop already overlaps waiting; one worker per CPU is enough.
+    default_workers = cpus
+
+workers = int(os.getenv('WEB_CONCURRENCY',
+                        default_workers if shared_cache else 1))
+if workers > 1 and not shared_cache:
+    raise RuntimeError(
+        f"{workers} workers need a shared cache; set CACHE_BACKEND=file "
+        "or run a single worker.")
+
+# Import Django once in the master so that workers fork with it loaded.
+preload_app = True
+
+# On SIGTERM, let in-flight requests finish before workers are killed.
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers now and then to contain memory growth.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    """Write votes still waiting in the write-behind queue before exiting."""
+    from polls.ingest import stop_vote_queue
+
+    stop_vote_queue()
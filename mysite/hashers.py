@@ -0,0 +1,39 @@
+"""
+Password hashers whose cost is read from the settings.
+
+Each class keeps the algorithm name of the Django hasher it extends, so
+existing hashes still verify. Django re-hashes a password at the next
+successful login when its hash was made with a different hasher than the
+first one in PASSWORD_HASHERS, or with other parameters. Changing
+PASSWORD_HASHER or a cost setting therefore upgrades (or cheapens) the
+stored hashes as users log in.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
@@ -0,0 +1,125 @@
+"""
+Logging off the request path.
+
+BoundedQueueHandler puts log records on a bounded in-memory queue and a
+background thread passes them to the real handlers, so a slow disk or
+terminal never delays a request. When the queue is full, records are
+dropped and counted instead of blocking; the count is reported at
+``/metrics/``.
+
+The listener thread is started by the first record logged in each process,
+so gunicorn workers forked from a preloaded master start their own.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes of every LogRecord; anything else on a record came from `extra`.
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message',
+                                                             'asctime'}
+
+_queue_handlers = weakref.WeakSet()
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in RECORD_ATTRS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room, so that stopping works even when the queue is full.
+        self.queue.put(self._sentinel)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hand records to the handlers named in `handlers` through a queue of at
+    most `maxsize` records, served by a background thread.
+    """
+
+    def __init__(self, handlers=(), maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        # dictConfig creates handlers in name order, so the targets must have
+        # names that sort before this handler's.
+        self.targets = [_resolve(handler) for handler in handlers]
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        _queue_handlers.add(self)
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Merge the arguments now, as they may change once the call returns,
+        # but leave formatting to the handlers on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Start the listener thread of this process."""
+        # A forked process must not share the queue of its parent.
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = _Listener(
+            self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        """Write the queued records and stop the listener thread."""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self._pid = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+def _resolve(handler):
+    """Return the handler configured under the name `handler`."""
+    if isinstance(handler, logging.Handler):
+        return handler
+    # logging.getHandlerByName() is new in Python 3.12.
+    return logging._handlers[handler]
+
+
+def dropped_log_records():
+    """Return how many records the queue handlers of this process dropped."""
+    return sum(handler.dropped for handler in _queue_handlers)
@@ -0,0 +1,201 @@
+"""
+Per-request query and latency metrics.
+
+RequestMetricsMiddleware counts the SQL queries of each request and times
+them, the template rendering and the whole request. The numbers are sent
+back in a ``Server-Timing`` header (when ``SERVER_TIMING`` is on), logged
+to the ``mysite.metrics`` logger, and added to per-view histograms that
+staff can read at ``/metrics/``. The histograms live in the memory of each
+worker process and start empty when it starts.
+
+Queries are seen through an execute wrapper installed on every database
+connection. It records into the metrics of the request running in the
+current context, which sync_to_async() carries over into the threads that
+run the ORM for async views.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('mysite.metrics')
+
+# Upper bounds of the histogram buckets; the last bucket has no bound.
+MS_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """The measurements of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self._render_start = None
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(1000 * self.db_time, 3),
+            'template_ms': round(1000 * self.template_time, 3),
+            'total_ms': round(1000 * self.total_time, 3),
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper that adds each query to the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install(connection, **kwargs):
+    """Add record_query() to the execute wrappers of `connection`."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install)
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, with their count and sum."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in self.bounds] + ['inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class MetricsRegistry:
+    """Histograms of the request metrics of each view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, metrics):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'db_ms': Histogram(MS_BUCKETS),
+                    'template_ms': Histogram(MS_BUCKETS),
+                    'total_ms': Histogram(MS_BUCKETS),
+                }
+            for name, value in metrics.as_dict().items():
+                histograms[name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {view: {name: histogram.as_dict()
+                           for name, histogram in histograms.items()}
+                    for view, histograms in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure each request. Put this middleware first so that its timing
+    covers the others.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened before the middleware was loaded.
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # Called just before the response is rendered, as the last of the
+        # template response hooks when this middleware comes first.
+        metrics = _current.get()
+        if metrics is not None:
+            metrics._render_start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: self.rendered(metrics))
+        return response
+
+    def rendered(self, metrics):
+        metrics.template_time += time.perf_counter() - metrics._render_start
+
+    def finish(self, request, response, metrics):
+        metrics.total_time = time.perf_counter() - metrics.start
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, metrics)
+        values = metrics.as_dict()
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={values["db_ms"]};desc="{metrics.queries} queries", '
+                f'tpl;dur={values["template_ms"]}, '
+                f'total;dur={values["total_ms"]}'
+            )
+        logger.info("%s %s %s %s", request.method, request.path, view,
+                    response.status_code,
+                    extra={'view': view, 'status': response.status_code,
+                           **values})
+        return response
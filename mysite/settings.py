@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,7 +44,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that its timings cover the other middleware.
+    'mysite.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Reads of users who just voted go to the primary database.
+    'polls.routers.StickToPrimaryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,13 +80,174 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE selects "sqlite" (default) or "postgres".
+
+# Seconds to keep a database connection open for later requests. Under ASGI
+# (SERVER_INTERFACE, as in gunicorn.conf.py) each request runs its queries in
+# a thread of its own, which never reuses the connection, so Django advises
+# closing it at the end of each request.
+_conn_max_age = config(
+    'DATABASE_CONN_MAX_AGE', cast=int,
+    default=0 if config('SERVER_INTERFACE', default='asgi') == 'asgi' else 60)
+
+if config('DATABASE_ENGINE', default='sqlite') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME'),
+            'USER': config('DATABASE_USER'),
+            'PASSWORD': config('DATABASE_PASSWORD'),
+            'HOST': config('DATABASE_HOST', default='localhost'),
+            'PORT': config('DATABASE_PORT', cast=int, default=5432),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if config('DATABASE_POOL', cast=bool, default=True):
+        # psycopg's connection pool; it replaces persistent connections,
+        # which Django does not allow together with pooling.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': config('DATABASE_POOL_MIN_SIZE', cast=int,
+                                   default=2),
+                'max_size': config('DATABASE_POOL_MAX_SIZE', cast=int,
+                                   default=10),
+                'timeout': config('DATABASE_POOL_TIMEOUT', cast=int,
+                                  default=10),
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = _conn_max_age
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': _conn_max_age,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # WAL lets readers run alongside the writer; NORMAL sync is
+                # safe with WAL and avoids an fsync on every commit.
+                'init_command': 'PRAGMA journal_mode=WAL; '
+                                'PRAGMA synchronous=NORMAL;',
+                # Seconds to wait for a lock (busy_timeout) before failing.
+                'timeout': config('SQLITE_BUSY_TIMEOUT', cast=int, default=20),
+                # Take the write lock when a transaction starts, so that two
+                # transactions never deadlock upgrading a read lock.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Read replicas of the database, as comma-separated SQLITE_REPLICA_PATHS or
+# DATABASE_REPLICA_HOSTS (with the primary's credentials). Poll reads go to
+# a random replica; writes, and the reads of a user for
+# POLLS_PRIMARY_STICKY_SECONDS after they vote, go to the primary
+# (see polls/routers.py).
+_sqlite = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+if _sqlite:
+    _replicas = [{'NAME': path}
+                 for path in config('SQLITE_REPLICA_PATHS', cast=Csv(),
+                                    default='')]
+else:
+    _replicas = [{'HOST': host}
+                 for host in config('DATABASE_REPLICA_HOSTS', cast=Csv(),
+                                    default='')]
+for _number, _replica in enumerate(_replicas, 1):
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], **_replica,
+                                      'TEST': {'MIRROR': 'default'}}
+POLLS_READ_REPLICAS = [f'replica{number}'
+                       for number in range(1, len(_replicas) + 1)]
+DATABASE_ROUTERS = ['polls.routers.ReplicaRouter']
+POLLS_PRIMARY_STICKY_SECONDS = config('POLLS_PRIMARY_STICKY_SECONDS',
+                                      cast=int, default=10)
+
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    # Tests read from the primary, except polls/tests/test_replicas.py,
+    # which reads this separate database as a replica.
+    POLLS_READ_REPLICAS = []
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'TEST': {'NAME': None if _sqlite
+                 else f"test_{DATABASES['default']['NAME']}_replica"},
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+if config('CACHE_BACKEND', default='locmem') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION',
+                               default=str(BASE_DIR / 'cache')),
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds to keep poll results in the cache. Votes invalidate them sooner.
+POLLS_RESULTS_CACHE_TIMEOUT = config('POLLS_RESULTS_CACHE_TIMEOUT', cast=int,
+                                     default=300)
+
+# Seconds that browsers and proxies may keep the results page of a closed
+# poll, whose results are frozen. A poll reopened within that time is still
+# shown as closed to those who kept the page.
+POLLS_FINAL_RESULTS_MAX_AGE = config('POLLS_FINAL_RESULTS_MAX_AGE', cast=int,
+                                     default=365 * 24 * 3600)
+
+# Seconds after a poll's end date before its results are frozen, so that
+# votes accepted before the end but still being written are counted.
+POLLS_FINAL_RESULTS_GRACE = config('POLLS_FINAL_RESULTS_GRACE', cast=int,
+                                   default=60)
+
+# Seconds to keep the index and results pages served to anonymous visitors.
+POLLS_PAGE_CACHE_TIMEOUT = config('POLLS_PAGE_CACHE_TIMEOUT', cast=int,
+                                  default=60)
+
+# Rows each choice's vote count is spread over, so that concurrent votes
+# for one choice do not all update the same row. Changing it is safe.
+POLLS_VOTE_COUNTER_SHARDS = config('POLLS_VOTE_COUNTER_SHARDS', cast=int,
+                                   default=8)
+
+# Seconds to keep each user's map of voted choices in the cache.
+POLLS_VOTED_CACHE_TIMEOUT = config('POLLS_VOTED_CACHE_TIMEOUT', cast=int,
+                                   default=3600)
+
+# Token buckets of polls/ratelimit.py: for each scope, the most requests a
+# client IP or user can make at once and the requests per second after that.
+POLLS_RATE_LIMITS = {
+    'vote': {
+        'burst': config('POLLS_VOTE_BURST', cast=int, default=30),
+        'rate': config('POLLS_VOTE_RATE', cast=float, default=1.0),
+    },
+    'login': {
+        'burst': config('POLLS_LOGIN_BURST', cast=int, default=10),
+        'rate': config('POLLS_LOGIN_RATE', cast=float, default=0.1),
+    },
 }
 
+# Addresses of the reverse proxies in front of the app. The rate limits
+# only trust X-Forwarded-For in requests that come from one of them.
+POLLS_TRUSTED_PROXIES = config('POLLS_TRUSTED_PROXIES', cast=Csv(), default='')
+
+# Live results stream: seconds between checks for new votes, events buffered
+# per watcher, seconds between keep-alive comments, and seconds before a
+# stream is closed and the browser reconnects.
+POLLS_STREAM_POLL_INTERVAL = config('POLLS_STREAM_POLL_INTERVAL', cast=float,
+                                    default=1.0)
+POLLS_STREAM_QUEUE_SIZE = 16
+POLLS_STREAM_HEARTBEAT = 15
+POLLS_STREAM_MAX_AGE = 300
+
+# Send query counts and timings in a Server-Timing header (mysite/metrics.py).
+SERVER_TIMING = config('SERVER_TIMING', cast=bool, default=DEBUG)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -98,14 +265,73 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
+# Hasher for new passwords: "pbkdf2" (default), "argon2" (needs argon2-cffi)
+# or "scrypt", with the costs below. The other hashers stay listed so that
+# their hashes still verify; each is re-hashed with the chosen hasher and
+# costs at the user's next login (see mysite/hashers.py).
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+_hashers = {
+    'pbkdf2': 'mysite.hashers.PBKDF2PasswordHasher',
+    'argon2': 'mysite.hashers.Argon2PasswordHasher',
+    'scrypt': 'mysite.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [_hashers.pop(PASSWORD_HASHER), *_hashers.values()]
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', cast=int,
+                                    default=1_000_000)
+PASSWORD_ARGON2_TIME_COST = config('PASSWORD_ARGON2_TIME_COST', cast=int,
+                                   default=2)
+PASSWORD_ARGON2_MEMORY_COST = config('PASSWORD_ARGON2_MEMORY_COST', cast=int,
+                                     default=102400)  # KiB
+PASSWORD_ARGON2_PARALLELISM = config('PASSWORD_ARGON2_PARALLELISM', cast=int,
+                                     default=8)
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', cast=int,
+                                     default=2 ** 14)
+
+if TESTING:
+    # Hashing at full cost would make every login in the tests take
+    # hundreds of milliseconds.
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
 AUTHENTICATION_BACKENDS = [
     # username & password authentication
     'django.contrib.auth.backends.ModelBackend',
 ]
+# How votes are written: "sync" saves each vote during the request, "queue"
+# buffers votes in memory and writes them in batches (see polls/ingest.py).
+POLLS_VOTE_INGESTION = config('POLLS_VOTE_INGESTION', default='sync')
+# With the queue, flush every N milliseconds or as soon as M votes are waiting.
+POLLS_VOTE_FLUSH_INTERVAL = config('POLLS_VOTE_FLUSH_INTERVAL', cast=int,
+                                   default=200)
+POLLS_VOTE_FLUSH_BATCH_SIZE = config('POLLS_VOTE_FLUSH_BATCH_SIZE', cast=int,
+                                     default=500)
+
+# Where sessions are kept: "db" (default), "cached_db", which reads them
+# from the cache and writes through to the database, or "signed_cookies",
+# which keeps them in the browser and never touches the database. Expired
+# db and cached_db sessions are deleted by `manage.py clearsessions`.
+# cached_db needs a cache that all processes share, or a logout in one of
+# them would leave the session cached in the others.
+_session_backend = config('SESSION_BACKEND', default='db')
+if (_session_backend == 'cached_db'
+        and CACHES['default']['BACKEND'].endswith('LocMemCache')):
+    raise ImproperlyConfigured(
+        "SESSION_BACKEND=cached_db needs a shared cache; set CACHE_BACKEND.")
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[_session_backend]
+
+# Flash messages, like the one after a vote, travel in a cookie instead of
+# the session, so that showing one does not save the session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 LOGIN_REDIRECT_URL = 'polls:index'  # after login, show list of polls
 LOGOUT_REDIRECT_URL = 'login'       # after logout, return to login page
 
 
+# Loggers write through the queue handlers, whose background threads do the
+# I/O (see mysite/log.py). The log file has one JSON object per line.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -118,6 +344,9 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'mysite.log.JSONFormatter',
+        },
     },
     'handlers': {
         'console': {
@@ -129,15 +358,32 @@ LOGGING = {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': os.getenv('DJANGO_LOG_FILE', 'default.log'),
-            'formatter': 'verbose',
+            'formatter': 'json',
+            'delay': True,
+        },
+        'queue': {
+            '()': 'mysite.log.BoundedQueueHandler',
+            'handlers': ['console', 'file'],
+            'maxsize': config('LOG_QUEUE_SIZE', cast=int, default=10000),
+        },
+        'queue_file': {
+            '()': 'mysite.log.BoundedQueueHandler',
+            'handlers': ['file'],
+            'maxsize': config('LOG_QUEUE_SIZE', cast=int, default=10000),
         },
     },
     'loggers': {
         'polls': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': True,
         },
+        # One record per request with its query count and timings.
+        'mysite.metrics': {
+            'handlers': ['queue_file'],
+            'level': config('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
 
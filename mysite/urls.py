@@ -15,9 +15,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
+from django.contrib.auth import views as auth_views
 from django.urls import include, path
 from django.views.generic.base import RedirectView
 from mysite import views
+from polls.ratelimit import rate_limit
 
 urlpatterns = [
     # Redirect base URL to polls index page
@@ -26,8 +28,13 @@ urlpatterns = [
     path('polls/', include('polls.urls')),
     # Admin URL
     path('admin/', admin.site.urls),
+    # login, with password guessing rate-limited
+    path('accounts/login/',
+         rate_limit('login')(auth_views.LoginView.as_view()), name='login'),
     # authentication backend
     path('accounts/', include('django.contrib.auth.urls')),
     # sign up page
     path('signup/', views.signup, name='signup'),
+    # request metrics histograms, for staff
+    path('metrics/', views.request_metrics, name='request_metrics'),
 ]
@@ -1,6 +1,13 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate
+from django.conf import settings
+from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from mysite.log import dropped_log_records
+from mysite.metrics import registry
+from polls.ratelimit import rejection_counts
 
 
 def signup(request):
@@ -8,13 +15,10 @@ def signup(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
-            # get named fields from the form data
-            username = form.cleaned_data.get('username')
-            # password input field is named 'password1'
-            raw_passwd = form.cleaned_data.get('password1')
-            user = authenticate(username=username, password=raw_passwd)
-            login(request, user)
+            user = form.save()
+            # Log the new user in directly: authenticating them would hash
+            # the password a second time.
+            login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
         return redirect('polls:index')
         # what if form is not valid?
         # we should display a message in signup.html
@@ -22,3 +26,14 @@ def signup(request):
         # create a user form and display it the signup page
         form = UserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
+
+
+@staff_member_required
+def request_metrics(request):
+    """
+    Return the request metrics histograms of each view, the number of
+    dropped log records and the rate-limited requests as JSON.
+    """
+    return JsonResponse({'views': registry.snapshot(),
+                         'log_records_dropped': dropped_log_records(),
+                         'rate_limited': rejection_counts()})
@@ -0,0 +1,265 @@
+"""
+Caching of poll results and of users' votes.
+
+Tallies are cached per question under a key that includes the question's
+results version. Recording votes or editing choices bumps the version, so
+stale tallies are never read again and simply expire. When several requests
+miss on the same poll at once, one of them takes a short-lived lock and
+rebuilds the tallies while the others wait for it.
+
+Tallies come from the stored vote counters, each choice's vote_count plus
+its VoteCounter shards, rather than from counting Vote rows. The counters of
+each question are also cached on their own under the same results version.
+
+Each user's votes are cached the same way, as a map from question id to the
+chosen choice id, so that pages can show the user's votes without querying
+them. Recording votes writes the updated map under a new version, taking a
+short-lived lock so that concurrent votes by the same user in different
+polls do not overwrite each other's update.
+
+The results of closed polls stop changing once the votes accepted before
+the end date are written, which POLLS_FINAL_RESULTS_GRACE allows time for.
+After that they come from a ResultsSnapshot, taken on the next request or
+by finalize_polls, and are cached without a version or timeout.
+
+Everything cached here is read from the primary database, since a lagging
+replica would leave stale values in the cache for everybody.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from .routers import use_primary
+
+RESULTS_KEY = 'polls:results:{question_id}:{version}'
+TOTALS_KEY = 'polls:vote-totals:{question_id}:{version}'
+FINAL_KEY = 'polls:final-results:{question_id}'
+VERSION_KEY = 'polls:results-version:{question_id}'
+LOCK_KEY = 'polls:results-lock:{question_id}'
+STATS_KEY = 'polls:results-cache:{name}'
+VOTED_KEY = 'polls:voted:{user_id}:{version}'
+VOTED_VERSION_KEY = 'polls:voted-version:{user_id}'
+VOTED_LOCK_KEY = 'polls:voted-lock:{user_id}'
+
+# How long a rebuild may hold the lock, and how long others wait for it.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+def compute_results(question):
+    """
+    Return the results of `question` as a dict with the total number of
+    votes and, for each choice, its id, text, votes and percentage.
+    """
+    with use_primary():
+        choices = list(tally_queryset(question))
+    return tally_results(choices)
+
+
+def tally_results(choices):
+    """
+    Return the results of `choices`, dicts with each choice's id, text and
+    votes, adding the total number of votes and each choice's percentage.
+    """
+    total_votes = sum(choice['votes'] for choice in choices)
+    for choice in choices:
+        choice['percentage'] = (100 * choice['votes'] / total_votes
+                                if total_votes else 0)
+    return {'total_votes': total_votes, 'choices': choices}
+
+
+def stored_votes():
+    """Return the expression of a choice's votes in its stored counters."""
+    return F('vote_count') + Coalesce(Sum('votecounter__count'), 0)
+
+
+def tally_queryset(question):
+    """Return the choices of `question` with their vote counts as dicts."""
+    return (question.choice_set.annotate(votes=stored_votes())
+            .order_by('pk').values('id', 'choice_text', 'votes'))
+
+
+def get_results(question):
+    """Return the results of `question`, from the cache when possible."""
+    if question.is_final():
+        return get_final_results(question)
+    key = RESULTS_KEY.format(question_id=question.pk,
+                             version=results_version(question.pk))
+    results = cache.get(key)
+    if results is not None:
+        _count('hits')
+        return results
+
+    _count('misses')
+    lock_key = LOCK_KEY.format(question_id=question.pk)
+    if not cache.add(lock_key, True, LOCK_TIMEOUT):
+        # Another request is rebuilding these results; wait for it.
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            results = cache.get(key)
+            if results is not None:
+                return results
+        return compute_results(question)
+
+    try:
+        results = compute_results(question)
+        cache.set(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return results
+
+
+def get_final_results(question):
+    """Return the results of the closed `question` from its snapshot."""
+    from .models import ResultsSnapshot
+
+    key = FINAL_KEY.format(question_id=question.pk)
+    results = cache.get(key)
+    if results is None:
+        with use_primary():
+            results = ResultsSnapshot.objects.take(question).as_results()
+        cache.set(key, results, None)
+    return results
+
+
+def forget_final_results(question_id):
+    """Drop the cached results of a question that is no longer closed."""
+    cache.delete(FINAL_KEY.format(question_id=question_id))
+
+
+def vote_totals(question_id):
+    """
+    Return the stored vote counts of a question as a dict with its total
+    and a dict mapping each choice id to the choice's count.
+    """
+    from .models import Choice
+
+    key = TOTALS_KEY.format(question_id=question_id,
+                            version=results_version(question_id))
+    totals = cache.get(key)
+    if totals is None:
+        with use_primary():
+            choices = dict(
+                Choice.objects.filter(question_id=question_id)
+                .annotate(votes=stored_votes()).values_list('pk', 'votes'))
+        totals = {'total': sum(choices.values()), 'choices': choices}
+        cache.set(key, totals, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return totals
+
+
+def results_version(question_id):
+    """Return the current results version of a question."""
+    return current_version(VERSION_KEY.format(question_id=question_id))
+
+
+def current_version(key):
+    """Return the version stored under `key`, creating one if needed."""
+    version = cache.get(key)
+    if version is None:
+        # Versions are random rather than counters, so a version that was
+        # evicted can never come back and match stale results.
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_results(*question_ids):
+    """Make the cached results of the given questions stale."""
+    cache.set_many({VERSION_KEY.format(question_id=question_id):
+                    uuid.uuid4().hex for question_id in question_ids}, None)
+
+
+def voted_choices(user_id):
+    """
+    Return a dict mapping the id of each question the user voted in to the
+    id of the chosen choice.
+    """
+    from .models import Vote
+
+    key = VOTED_KEY.format(
+        user_id=user_id,
+        version=current_version(VOTED_VERSION_KEY.format(user_id=user_id)))
+    choices = cache.get(key)
+    if choices is None:
+        with use_primary():
+            choices = dict(Vote.objects.filter(user_id=user_id)
+                           .values_list('question_id', 'choice_id'))
+        cache.set(key, choices, settings.POLLS_VOTED_CACHE_TIMEOUT)
+    return choices
+
+
+def remember_votes(ballots):
+    """
+    Record in the cached vote maps the votes in `ballots`, a dict mapping
+    (user id, question id) to a choice id. Maps that are not cached are only
+    made stale, to be loaded again when needed.
+    """
+    changes = {}
+    for (user_id, question_id), choice_id in ballots.items():
+        changes.setdefault(user_id, {})[question_id] = choice_id
+    for user_id, user_changes in changes.items():
+        lock_key = VOTED_LOCK_KEY.format(user_id=user_id)
+        if not _wait_for_lock(lock_key):
+            forget_votes(user_id)
+            continue
+        try:
+            version_key = VOTED_VERSION_KEY.format(user_id=user_id)
+            choices = cache.get(VOTED_KEY.format(
+                user_id=user_id, version=current_version(version_key)))
+            version = uuid.uuid4().hex
+            if choices is not None:
+                choices.update(user_changes)
+                cache.set(VOTED_KEY.format(user_id=user_id, version=version),
+                          choices, settings.POLLS_VOTED_CACHE_TIMEOUT)
+            cache.set(version_key, version, None)
+        finally:
+            cache.delete(lock_key)
+
+
+def _wait_for_lock(lock_key):
+    """Take the lock under `lock_key`, waiting up to LOCK_WAIT for it."""
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, True, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(LOCK_POLL_INTERVAL)
+    return True
+
+
+def forget_votes(*user_ids):
+    """Make the cached vote maps of the given users stale."""
+    cache.set_many({VOTED_VERSION_KEY.format(user_id=user_id):
+                    uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def results_cache_stats():
+    """Return the hit and miss counts of the results cache."""
+    hits = cache.get(STATS_KEY.format(name='hits'), 0)
+    misses = cache.get(STATS_KEY.format(name='misses'), 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else None,
+    }
+
+
+def increment(key):
+    """Add one to the counter stored under `key`, which never expires."""
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add() and incr().
+        cache.add(key, 1, None)
+
+
+def _count(name):
+    increment(STATS_KEY.format(name=name))
@@ -0,0 +1,87 @@
+"""
+Export of poll results as CSV or JSON Lines.
+
+Rows are encoded one at a time and votes are read from the database in
+chunks of ``EXPORT_CHUNK_SIZE`` ordered by id, so an export uses the same
+amount of memory however many votes it contains. A vote dump can be resumed
+by passing the id of the last exported vote as ``after``.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Vote
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+}
+
+CHOICE_FIELDS = ['choice_id', 'choice_text', 'votes', 'percentage']
+VOTE_FIELDS = ['id', 'question_id', 'choice_id', 'user_id']
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object that returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+_csv_writer = csv.writer(Echo())
+
+
+def choice_rows(results):
+    """Return the per-choice rows of the results of a question."""
+    return [{'choice_id': choice['id'],
+             'choice_text': choice['choice_text'],
+             'votes': choice['votes'],
+             'percentage': round(choice['percentage'], 2)}
+            for choice in results['choices']]
+
+
+def vote_rows(question_ids=None, after=None):
+    """
+    Return a queryset of the votes in the given questions (all questions if
+    None) with an id greater than `after`, as dicts ordered by id.
+    """
+    votes = Vote.objects.order_by('id')
+    if question_ids is not None:
+        votes = votes.filter(question_id__in=question_ids)
+    if after is not None:
+        votes = votes.filter(id__gt=after)
+    return votes.values(*VOTE_FIELDS)
+
+
+def encode_header(fields, format):
+    """Return the header line of an export, or '' if it has none."""
+    return _csv_writer.writerow(fields) if format == 'csv' else ''
+
+
+def encode_row(row, fields, format):
+    """Return `row` encoded as one line of an export."""
+    if format == 'csv':
+        return _csv_writer.writerow([row[field] for field in fields])
+    return json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(rows, fields, format):
+    """Yield the lines of an export of `rows`."""
+    header = encode_header(fields, format)
+    if header:
+        yield header
+    for row in rows:
+        yield encode_row(row, fields, format)
+
+
+async def aexport_lines(rows, fields, format):
+    """Yield the lines of an export of the async iterable `rows`."""
+    header = encode_header(fields, format)
+    if header:
+        yield header
+    async for row in rows:
+        yield encode_row(row, fields, format)
@@ -0,0 +1,169 @@
+"""
+Write-behind ingestion of votes.
+
+When ``POLLS_VOTE_INGESTION`` is ``"queue"``, the vote view only validates a
+vote and hands it to the process-wide VoteQueue. A background thread writes
+the queued votes to the database in batches, either every
+``POLLS_VOTE_FLUSH_INTERVAL`` milliseconds or as soon as
+``POLLS_VOTE_FLUSH_BATCH_SIZE`` votes are waiting. Repeated votes by the same
+user in the same poll are coalesced, so only the latest one is written.
+
+The queue lives in the memory of one process. A voter's own requests served
+by the same process see their pending vote (read-your-writes): the detail
+and index pages mark it, and add_pending_vote() adds it to the results
+without writing it first. Other processes see it after the next flush.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+
+from .cache import tally_results
+from .models import Vote
+
+logger = logging.getLogger('polls')
+
+
+class VoteQueue:
+    """
+    An in-process buffer of votes that is flushed to the database in batches
+    by a background thread.
+    """
+
+    def __init__(self, flush_interval=0.2, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._writing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def submit(self, user_id, question_id, choice_id):
+        """
+        Queue a vote, replacing any queued vote by the same user in the same
+        poll.
+        """
+        with self._lock:
+            self._pending[(user_id, question_id)] = choice_id
+            waiting = len(self._pending)
+            if self._thread is None:
+                self._start()
+        if waiting >= self.batch_size:
+            self._wakeup.set()
+
+    def pending_choice(self, user_id, question_id):
+        """
+        Return the choice id of a vote that is queued or being written, or
+        None.
+        """
+        key = (user_id, question_id)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._writing.get(key)
+
+    def flush(self):
+        """Write all queued votes to the database now."""
+        with self._flush_lock:
+            with self._lock:
+                ballots, self._pending = self._pending, {}
+                # Pending until written, so voters never miss their vote.
+                self._writing = ballots
+            if not ballots:
+                return 0
+            try:
+                Vote.objects.record_many(ballots)
+            except Exception:
+                # Put the votes back unless the users have voted again since.
+                with self._lock:
+                    for key, choice_id in ballots.items():
+                        self._pending.setdefault(key, choice_id)
+                raise
+            finally:
+                with self._lock:
+                    self._writing = {}
+            return len(ballots)
+
+    def stop(self):
+        """Stop the background thread and write the remaining votes."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='vote-flusher',
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+
+        try:
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                if self._stopping:
+                    # stop() writes the remaining votes itself.
+                    break
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Failed to write queued votes")
+        finally:
+            connection.close()
+
+
+def add_pending_vote(results, previous_choice_id, choice_id):
+    """
+    Return a copy of `results` that counts a pending vote for `choice_id`,
+    moved from `previous_choice_id` if the voter had voted in the poll.
+    """
+    if choice_id == previous_choice_id:
+        return results
+    choices = []
+    for choice in results['choices']:
+        choice = dict(choice)
+        if choice['id'] == choice_id:
+            choice['votes'] += 1
+        elif choice['id'] == previous_choice_id:
+            choice['votes'] -= 1
+        choices.append(choice)
+    return tally_results(choices)
+
+
+_vote_queue = None
+_vote_queue_lock = threading.Lock()
+
+
+def get_vote_queue():
+    """Return the process-wide VoteQueue, creating it on first use."""
+    global _vote_queue
+    with _vote_queue_lock:
+        if _vote_queue is None:
+            _vote_queue = VoteQueue(
+                flush_interval=settings.POLLS_VOTE_FLUSH_INTERVAL / 1000,
+                batch_size=settings.POLLS_VOTE_FLUSH_BATCH_SIZE,
+            )
+            atexit.register(stop_vote_queue)
+        return _vote_queue
+
+
+def stop_vote_queue():
+    """Write any queued votes and stop the flusher, if the queue was used."""
+    with _vote_queue_lock:
+        queue = _vote_queue
+    if queue is not None:
+        queue.stop()
+
+
+def queue_enabled():
+    """Return True if votes are ingested through the write-behind queue."""
+    return settings.POLLS_VOTE_INGESTION == 'queue'
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import VoteCounter
+
+
+class Command(BaseCommand):
+    help = ("Fold the sharded vote counters into the vote counts of choices "
+            "and questions. Run it periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help="Only compact the counters of these questions.",
+        )
+
+    def handle(self, *args, **options):
+        shards = VoteCounter.objects.compact(options['question_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {shards} vote counter shards."
+        ))
@@ -0,0 +1,99 @@
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from polls.cache import tally_queryset
+from polls.export import vote_rows
+from polls.models import Choice, Question, Vote
+from polls.views import IndexView, encode_cursor
+
+
+class Command(BaseCommand):
+    help = ("Print the query plans of the hot queries of the polls views, "
+            "optionally against a generated dataset that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help="Generate a dataset first and roll it back afterwards.",
+        )
+        parser.add_argument('--questions', type=int, default=1000)
+        parser.add_argument('--choices', type=int, default=4,
+                            help="Choices per question.")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--votes-per-user', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options)
+            self.explain_all()
+            transaction.set_rollback(options['seed'])
+
+    def explain_all(self):
+        vote = Vote.objects.order_by('pk').first()
+        if vote is None:
+            raise CommandError("There are no votes to explain queries for; "
+                               "use --seed to generate some.")
+        question = vote.question
+
+        view = IndexView()
+        view.setup(RequestFactory().get('/'))
+        first_page = view.get_queryset()[:view.page_size + 1]
+        view.setup(RequestFactory().get(
+            '/', {view.cursor_param: encode_cursor(question)}))
+        later_page = view.get_queryset()[:view.page_size + 1]
+
+        hotpaths = [
+            ("Index, first page", first_page),
+            ("Index, later page", later_page),
+            ("Detail, the user's vote",
+             Vote.objects.filter(user=vote.user_id, question=question)
+             .values_list('choice_id', flat=True).order_by('pk')[:1]),
+            ("Results, tallies", tally_queryset(question)),
+            ("Vote, existing votes of the voter",
+             Vote.objects.filter(user_id__in=[vote.user_id],
+                                 question_id__in=[question.pk])
+             .values_list('user_id', 'question_id', 'choice_id')),
+            ("Export, votes of a poll", vote_rows([question.pk], vote.pk)),
+        ]
+        for name, queryset in hotpaths:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}:"))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write("")
+
+    def seed(self, options):
+        now = timezone.now()
+        questions = Question.objects.bulk_create(
+            Question(question_text=f"Question {i}",
+                     pub_date=now - datetime.timedelta(hours=i),
+                     end_date=(now + datetime.timedelta(days=1)
+                               if i % 2 else None))
+            for i in range(options['questions']))
+        choices = Choice.objects.bulk_create(
+            Choice(question=question, choice_text=f"Choice {j}")
+            for question in questions for j in range(options['choices']))
+        users = User.objects.bulk_create(
+            User(username=f"hotpaths-{i}")
+            for i in range(options['users']))
+
+        choices_by_question = {}
+        for choice in choices:
+            choices_by_question.setdefault(choice.question_id, []).append(choice)
+        votes_per_user = min(options['votes_per_user'], len(questions))
+        Vote.objects.bulk_create(
+            (Vote(user=user, question=question,
+                  choice=random.choice(choices_by_question[question.pk]))
+             for user in users
+             for question in random.sample(questions, votes_per_user)),
+            batch_size=5000)
+        # Let the planner see the new table sizes.
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from polls.cache import compute_results
+from polls.export import (CHOICE_FIELDS, EXPORT_CHUNK_SIZE, FORMATS,
+                          VOTE_FIELDS, choice_rows, export_lines, vote_rows)
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    help = ("Export the votes of polls as CSV or JSON Lines, either one row "
+            "per vote or one row per choice with --aggregate.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help="Only export the votes of these questions.",
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, default='csv',
+            help="Output format (default: csv).",
+        )
+        parser.add_argument(
+            '--aggregate', action='store_true',
+            help="Export the vote count of each choice instead of each vote.",
+        )
+        parser.add_argument(
+            '--after', type=int,
+            help="Only export votes with an id greater than this one.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help="Number of votes to fetch from the database at a time.",
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help="Write to this file instead of standard output.",
+        )
+
+    def handle(self, *args, **options):
+        question_ids = options['question_ids'] or None
+        if options['aggregate']:
+            fields = ['question_id'] + CHOICE_FIELDS
+            rows = self.aggregate_rows(question_ids)
+        else:
+            fields = VOTE_FIELDS
+            rows = vote_rows(question_ids, options['after']).iterator(
+                chunk_size=options['chunk_size'])
+
+        lines = export_lines(rows, fields, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as stream:
+                stream.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def aggregate_rows(self, question_ids):
+        questions = Question.objects.order_by('pk')
+        if question_ids is not None:
+            questions = questions.filter(pk__in=question_ids)
+        for question in questions.iterator():
+            for row in choice_rows(compute_results(question)):
+                yield {'question_id': question.pk, **row}
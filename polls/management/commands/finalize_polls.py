@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import ArchivedVote, Question, ResultsSnapshot
+
+
+class Command(BaseCommand):
+    help = ("Freeze the results of closed polls into snapshots, and "
+            "optionally move their votes out of the Vote table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help="Only finalize these questions.",
+        )
+        parser.add_argument(
+            '--archive-votes', action='store_true',
+            help="Move the votes of finalized polls to the archive table. "
+                 "Reopening a poll moves its votes back.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of votes to archive per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.final()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+
+        taken = 0
+        for question in questions.filter(resultssnapshot__isnull=True):
+            ResultsSnapshot.objects.take(question)
+            taken += 1
+        self.stdout.write(f"Took {taken} results snapshots.")
+
+        if options['archive_votes']:
+            archived = 0
+            for question_id in questions.values_list('pk', flat=True):
+                archived += ArchivedVote.objects.archive(
+                    question_id, options['batch_size'])
+            self.stdout.write(f"Archived {archived} votes.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Finalized {questions.count()} closed polls."
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from polls.cache import invalidate_results
+from polls.models import Choice, Question, Vote, VoteCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored vote counters of choices and questions from Vote rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help="Only rebuild the counters of these questions.",
+        )
+        parser.add_argument(
+            '--keep-choices', nargs='+', type=int, default=[],
+            help="Keep the stored counts of these choices, such as legacy "
+                 "counts that have no Vote rows.",
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.all()
+        choices = Choice.objects.all()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+            choices = choices.filter(question__in=options['question_ids'])
+        choices = choices.exclude(pk__in=options['keep_choices'])
+
+        votes = (Vote.objects.filter(choice=OuterRef('pk'))
+                 .values('choice').annotate(total=Count('pk')).values('total'))
+        totals = (Choice.objects.filter(question=OuterRef('pk'))
+                  .values('question').annotate(total=Sum('vote_count'))
+                  .values('total'))
+        with transaction.atomic():
+            choice_rows = choices.update(vote_count=Coalesce(Subquery(votes), 0))
+            question_rows = questions.update(
+                vote_count=Coalesce(Subquery(totals), 0))
+            # The rebuilt counts include the votes held in the shards.
+            VoteCounter.objects.filter(choice__in=choices).update(count=0)
+        invalidate_results(*questions.values_list('pk', flat=True))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt vote counts for {question_rows} questions "
+            f"and {choice_rows} choices."
+        ))
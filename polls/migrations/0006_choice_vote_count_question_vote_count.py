@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_existing_votes(apps, schema_editor):
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    votes = (Vote.objects.filter(choice=OuterRef('pk'))
+             .values('choice').annotate(total=Count('pk')).values('total'))
+    Choice.objects.update(vote_count=Coalesce(Subquery(votes), 0))
+    totals = (Choice.objects.filter(question=OuterRef('pk'))
+              .values('question').annotate(total=Sum('vote_count'))
+              .values('total'))
+    Question.objects.update(vote_count=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_alter_vote_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:40
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def dedupe_votes(apps, schema_editor):
+    """
+    Fill in Vote.question from the voted choice and keep only the latest vote
+    of each user in each poll, then recount the stored vote counters.
+    """
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+
+    Vote.objects.update(question=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice')).values('question')[:1]))
+
+    seen = set()
+    duplicates = []
+    rows = Vote.objects.order_by('-pk').values_list('pk', 'user', 'question')
+    for pk, user_id, question_id in rows.iterator():
+        if (user_id, question_id) in seen:
+            duplicates.append(pk)
+        else:
+            seen.add((user_id, question_id))
+    for start in range(0, len(duplicates), 500):
+        Vote.objects.filter(pk__in=duplicates[start:start + 500]).delete()
+
+    votes = (Vote.objects.filter(choice=OuterRef('pk'))
+             .values('choice').annotate(total=Count('pk')).values('total'))
+    Choice.objects.update(vote_count=Coalesce(Subquery(votes), 0))
+    totals = (Choice.objects.filter(question=OuterRef('pk'))
+              .values('question').annotate(total=Sum('vote_count'))
+              .values('total'))
+    Question.objects.update(vote_count=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_vote_question'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_votes, migrations.RunPython.noop),
+    ]
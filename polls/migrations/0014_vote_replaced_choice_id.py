@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_resultssnapshot_archivedvote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='replaced_choice_id',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -1,13 +1,66 @@
 import datetime
+from collections import Counter, defaultdict
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 
+from .cache import (compute_results, forget_votes, invalidate_results,
+                    remember_votes, vote_totals)
+
 
 # Create your models here.
 
 
+class QuestionQuerySet(models.QuerySet):
+    """
+    Filters on the voting window of questions. Each method takes an optional
+    `now` so that one request can use the same instant for every check.
+    """
+
+    def published(self, now=None):
+        """Questions whose publication date has passed."""
+        return self.filter(pub_date__lte=now or timezone.now())
+
+    def open(self, now=None):
+        """Published questions that can be voted in."""
+        now = now or timezone.now()
+        return self.published(now).filter(_open_q(now))
+
+    def closed(self, now=None):
+        """Published questions whose end date has passed."""
+        now = now or timezone.now()
+        return self.published(now).filter(end_date__lt=now)
+
+    def final(self, now=None):
+        """Closed questions whose results can no longer change."""
+        now = now or timezone.now()
+        return self.closed(now - final_results_grace())
+
+    def with_status(self, now=None):
+        """
+        Annotate each question with `is_open`, as can_vote() would say. This
+        applies the rule of open() and closed() to listings; it is no faster
+        than calling can_vote() on each row.
+        """
+        now = now or timezone.now()
+        return self.annotate(is_open=Case(
+            When(Q(pub_date__lte=now) & _open_q(now), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+
+def _open_q(now):
+    return Q(end_date__isnull=True) | Q(end_date__gte=now)
+
+
+def final_results_grace():
+    return datetime.timedelta(seconds=settings.POLLS_FINAL_RESULTS_GRACE)
+
+
 class Question(models.Model):
     """
     The Question model represents a poll question in the system. It contains
@@ -16,11 +69,24 @@ class Question(models.Model):
     published, while is_published returns True if the current date/time is on
     or after the publication date. The can_vote method determines if voting is
     allowed based on the current date/time in relation to the publication and
-    end dates.
+    end dates. ‘vote_count’ is the compacted part of the poll's vote total;
+    votes since the last compaction are held in VoteCounter shards, and
+    total_votes adds both. Question.objects.open(), closed() and
+    with_status() apply the same rules in SQL.
     """
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published', default=timezone.now)
     end_date = models.DateTimeField('end date', null=True, blank=True)
+    vote_count = models.IntegerField(default=0, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the newest-first keyset pagination of the index page.
+            models.Index(fields=['-pub_date', '-id'],
+                         name='polls_question_pub_id_idx'),
+        ]
 
     def __str__(self):
         return self.question_text
@@ -29,58 +95,404 @@ class Question(models.Model):
         now = timezone.now()
         return now - datetime.timedelta(days=1) <= self.pub_date <= now
 
-    def is_published(self):
+    def is_published(self, now=None):
         """
-        Return True if current date/time is on or after question's
+        Return True if current date/time (or `now`) is on or after question's
         publication date.
         """
-        return timezone.localtime() >= self.pub_date
+        return (now or timezone.now()) >= self.pub_date
 
-    def can_vote(self):
+    def can_vote(self, now=None):
         """
         Returns True if voting is allowed for this question.
-        Voting is allowed if the current date/time is between pub_date
-        and end_date. If end_date is None, voting is allowed anytime after
-        pub_date.
+        Voting is allowed if the current date/time (or `now`) is between
+        pub_date and end_date. If end_date is None, voting is allowed anytime
+        after pub_date.
         """
-        now = timezone.localtime()
+        now = now or timezone.now()
         if self.end_date:
             return self.pub_date <= now <= self.end_date
         return now >= self.pub_date
 
+    def is_closed(self, now=None):
+        """
+        Returns True if the question's end date has passed.
+        """
+        return (self.end_date is not None
+                and self.end_date < (now or timezone.now()))
+
+    def is_final(self, now=None):
+        """
+        Returns True if the question's results can no longer change: its end
+        date passed more than POLLS_FINAL_RESULTS_GRACE seconds ago, leaving
+        time for the votes accepted before it to be written.
+        """
+        return self.is_closed((now or timezone.now()) - final_results_grace())
+
+    @property
+    def total_votes(self):
+        """return the number of votes in this poll"""
+        return vote_totals(self.pk)['total']
+
 
 class Choice(models.Model):
     """
     The Choice model represents a choice within a poll. It contains fields for
     ‘question’ (a foreign key relationship with the Question model),
-    ‘choice_text’, and ‘votes’.
+    ‘choice_text’, and ‘vote_count’, the compacted part of the stored count
+    of votes for this choice. The votes property adds the choice's
+    VoteCounter shards.
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.IntegerField(default=0, editable=False)
 
     @property
     def votes(self):
         """return the votes for this choice"""
-        return self.vote_set.count()
+        return vote_totals(self.question_id)['choices'].get(self.pk, 0)
 
     def __str__(self):
         return self.choice_text
 
 
+class VoteManager(models.Manager):
+
+    def record(self, user, choice):
+        """
+        Record a vote by `user` for `choice`, replacing the user's earlier vote
+        in the same poll, and update the stored vote counters to match.
+        Return the id of the previously voted choice, or None for a new vote.
+        """
+        key = (user.pk, choice.question_id)
+        return self.record_many({key: choice.pk})[key]
+
+    def record_many(self, ballots):
+        """
+        Record a batch of votes given as a dict mapping (user id, question id)
+        to the id of the chosen choice, and update the stored vote counters.
+        The votes are written with a single upsert on (user, question), which
+        also returns the choice that each changed vote replaced. The counters
+        are adjusted from that, so nothing is read or locked beforehand.
+        Return a dict mapping the same keys to the previously voted choice id,
+        or None for new votes.
+        """
+        if not ballots:
+            return {}
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        items = list(ballots.items())
+        batch_size = connection.ops.bulk_batch_size(
+            ['user_id', 'question_id', 'choice_id'], items)
+        with transaction.atomic(using=using):
+            replaced = {}
+            for start in range(0, len(items), batch_size):
+                replaced.update(self._upsert(
+                    connection, items[start:start + batch_size]))
+            # Votes that already had the chosen choice were left alone.
+            previous = {key: replaced.get(key, choice_id)
+                        for key, choice_id in ballots.items()}
+            changed = {key: ballots[key] for key in replaced}
+            if not changed:
+                return previous
+
+            deltas = Counter()
+            for (user_id, question_id), choice_id in changed.items():
+                shard = counter_shard(user_id)
+                deltas[(question_id, choice_id, shard)] += 1
+                if previous[(user_id, question_id)] is not None:
+                    deltas[(question_id, previous[(user_id, question_id)],
+                            shard)] -= 1
+            VoteCounter.objects.add(deltas)
+            remember_votes(changed)
+        invalidate_results(*{question_id for _, question_id in changed})
+        return previous
+
+    def _upsert(self, connection, items):
+        """
+        Insert or update the votes in `items`, ((user id, question id),
+        choice id) pairs, in one statement. Return a dict mapping the key of
+        each vote written to the id of the choice it replaced, or None for
+        new votes. Votes that already have their choice are not written.
+        """
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        user, question, choice, replaced = (
+            qn(name) for name in ('user_id', 'question_id', 'choice_id',
+                                  'replaced_choice_id'))
+        values = ', '.join(['(%s, %s, %s)'] * len(items))
+        params = [value for (user_id, question_id), choice_id in items
+                  for value in (user_id, question_id, choice_id)]
+        # SET sees the row as it was, so the old choice is kept in
+        # replaced_choice_id and returned.
+        sql = (
+            f'INSERT INTO {table} ({user}, {question}, {choice}) '
+            f'VALUES {values} '
+            f'ON CONFLICT ({user}, {question}) DO UPDATE '
+            f'SET {choice} = EXCLUDED.{choice}, '
+            f'{replaced} = {table}.{choice} '
+            f'WHERE {table}.{choice} <> EXCLUDED.{choice} '
+            f'RETURNING {user}, {question}, {replaced}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {(user_id, question_id): replaced_choice_id
+                    for user_id, question_id, replaced_choice_id
+                    in cursor.fetchall()}
+
+
+def counter_shard(user_id):
+    """Return the VoteCounter shard that the votes of a user are added to."""
+    return user_id % settings.POLLS_VOTE_COUNTER_SHARDS
+
+
+def _apply_deltas(queryset, deltas, field='vote_count'):
+    """Add each delta in `deltas`, keyed by pk, to the rows' `field`."""
+    pks_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            pks_by_delta[delta].append(pk)
+    for delta, pks in pks_by_delta.items():
+        queryset.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+class VoteCounterManager(models.Manager):
+
+    def add(self, deltas):
+        """
+        Add the deltas in `deltas`, a dict mapping (question id, choice id,
+        shard) to a change in votes, to the matching shards, creating the
+        shards that do not exist yet.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        # Creating missing shards first, and never deleting them, means
+        # the increments below always find their row.
+        self.bulk_create(
+            [self.model(question_id=question_id, choice_id=choice_id,
+                        shard=shard)
+             for question_id, choice_id, shard in deltas],
+            ignore_conflicts=True,
+        )
+        whens = [When(Q(choice_id=choice_id, shard=shard), then=Value(delta))
+                 for (_, choice_id, shard), delta in deltas.items()]
+        condition = Q()
+        for when in whens:
+            condition |= when.condition
+        self.filter(condition).update(
+            count=F('count') + Case(*whens, default=Value(0)))
+
+    def compact(self, question_ids=None):
+        """
+        Move the counts held in shards into Choice.vote_count and
+        Question.vote_count, leaving the shards at zero. Totals do not
+        change. Return the number of shards that were compacted.
+        """
+        shards = self.exclude(count=0)
+        if question_ids is not None:
+            shards = shards.filter(question_id__in=question_ids)
+        with transaction.atomic():
+            rows = list(shards.select_for_update()
+                        .values_list('pk', 'question_id', 'choice_id', 'count'))
+            choice_deltas = Counter()
+            question_deltas = Counter()
+            shard_deltas = {}
+            for pk, question_id, choice_id, count in rows:
+                choice_deltas[choice_id] += count
+                question_deltas[question_id] += count
+                # Subtract what was read rather than setting zero, so that
+                # nothing added to the shard meanwhile is lost.
+                shard_deltas[pk] = -count
+            _apply_deltas(Choice.objects, choice_deltas)
+            _apply_deltas(Question.objects, question_deltas)
+            _apply_deltas(self.all(), shard_deltas, field='count')
+        return len(rows)
+
+
+class VoteCounter(models.Model):
+    """
+    One shard of the vote count of a choice. Votes are added to the shard
+    picked by the voter's id instead of to Choice.vote_count, so that
+    concurrent votes for a popular choice update different rows. A choice's
+    votes are its vote_count plus its shards; compact_vote_counters folds
+    the shards back into vote_count.
+    """
+
+    # The unique constraint below starts with choice.
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+                               db_index=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    objects = VoteCounterManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'],
+                                    name='polls_votecounter_choice_shard'),
+        ]
+
+
 class Vote(models.Model):
     """
-    A vote by a user for a choice in a poll.
+    A vote by a user for a choice in a poll. ‘question’ duplicates
+    ‘choice.question’ so that the database can enforce one vote per user
+    in each poll.
     """
 
+    # The indexes below start with question and user, so these foreign keys
+    # need no index of their own.
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 db_index=False)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # The choice that the last change of this vote replaced. The vote upsert
+    # of VoteManager.record_many() writes and returns it, to adjust the
+    # counters. It is not a foreign key, since the choice may be gone.
+    replaced_choice_id = models.BigIntegerField(null=True, editable=False)
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            # Also serves the lookup of a user's vote in a poll.
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='polls_vote_one_per_user_question'),
+        ]
+        indexes = [
+            # Walks the votes of one poll in id order, as exports do.
+            models.Index(fields=['question', 'id'],
+                         name='polls_vote_question_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.question_id is None and self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
+
+class ResultsSnapshotManager(models.Manager):
+
+    def take(self, question):
+        """
+        Return the snapshot of the results of `question`, counting them and
+        storing the snapshot if there is none yet.
+        """
+        snapshot = self.filter(question=question).first()
+        if snapshot is None:
+            from .ingest import get_vote_queue, queue_enabled
+
+            if queue_enabled():
+                # Other processes flush theirs within the grace period.
+                get_vote_queue().flush()
+            results = compute_results(question)
+            snapshot, _ = self.get_or_create(question=question, defaults={
+                'total_votes': results['total_votes'],
+                'choices': [[choice['id'], choice['choice_text'],
+                             choice['votes']]
+                            for choice in results['choices']],
+            })
+        return snapshot
 
 
-def get_client_ip(request):
-    """Get the visitor’s IP address using request headers."""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+class ResultsSnapshot(models.Model):
+    """
+    The final results of a closed poll, counted once. ‘choices’ holds an
+    [id, text, votes] list for each choice, in id order.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True)
+    total_votes = models.IntegerField()
+    choices = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ResultsSnapshotManager()
+
+    def as_results(self):
+        """Return the results in the form of compute_results()."""
+        total = self.total_votes
+        return {
+            'total_votes': total,
+            'choices': [{'id': pk, 'choice_text': text, 'votes': votes,
+                         'percentage': 100 * votes / total if total else 0}
+                        for pk, text, votes in self.choices],
+        }
+
+
+class ArchivedVoteManager(models.Manager):
+
+    def archive(self, question_id, batch_size):
+        """
+        Move the votes of a question from Vote to the archive, `batch_size`
+        votes per transaction, and take them out of the vote counters.
+        Return the number of votes moved.
+        """
+        archived = 0
+        while True:
+            with transaction.atomic():
+                votes = list(Vote.objects.filter(question_id=question_id)
+                             .order_by('pk')
+                             .values_list('pk', 'choice_id', 'user_id')
+                             [:batch_size])
+                if not votes:
+                    invalidate_results(question_id)
+                    return archived
+                self.bulk_create(
+                    [self.model(id=pk, question_id=question_id,
+                                choice_id=choice_id, user_id=user_id)
+                     for pk, choice_id, user_id in votes],
+                    ignore_conflicts=True,
+                )
+                # Deleting sends post_delete, which makes the users' cached
+                # vote maps stale; the counters are adjusted here in bulk.
+                Vote.objects.filter(pk__in=[pk for pk, _, _ in votes]).delete()
+                VoteCounter.objects.add(
+                    _counter_deltas(question_id, votes, -1))
+            archived += len(votes)
+
+    def restore(self, question_id):
+        """
+        Move the archived votes of a question back to Vote, for a poll that
+        was reopened, and count them again. Return the number of votes moved.
+        """
+        with transaction.atomic():
+            votes = list(self.filter(question_id=question_id)
+                         .values_list('pk', 'choice_id', 'user_id'))
+            if not votes:
+                return 0
+            Vote.objects.bulk_create(
+                [Vote(id=pk, question_id=question_id, choice_id=choice_id,
+                      user_id=user_id)
+                 for pk, choice_id, user_id in votes],
+                batch_size=1000,
+            )
+            VoteCounter.objects.add(_counter_deltas(question_id, votes, 1))
+            self.filter(question_id=question_id).delete()
+        forget_votes(*{user_id for _, _, user_id in votes})
+        invalidate_results(question_id)
+        return len(votes)
+
+
+def _counter_deltas(question_id, votes, sign):
+    """Return the VoteCounter deltas of (pk, choice id, user id) `votes`."""
+    deltas = Counter()
+    for _, choice_id, user_id in votes:
+        deltas[(question_id, choice_id, counter_shard(user_id))] += sign
+    return deltas
+
+
+class ArchivedVote(models.Model):
+    """
+    A vote in a closed poll, moved out of the Vote table by
+    ``finalize_polls --archive-votes`` once the poll's results were frozen.
+    It keeps the id it had as a Vote, and is moved back if the poll is
+    reopened.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    objects = ArchivedVoteManager()
@@ -0,0 +1,112 @@
+"""
+Whole-page caching for anonymous visitors.
+
+Requests without a session or messages cookie get the same page as every
+other such visitor, so their index and results pages are cached per URL.
+The cache key and the ETag include a content version: the version of all
+questions for the index, and that plus the question's results version for
+the results page. Editing questions or recording votes changes the version,
+so a changed page gets a new key and a new ETag. The index also changes when
+polls open or close, so its version also rolls over every
+``POLLS_PAGE_CACHE_TIMEOUT`` seconds.
+
+Conditional GETs whose ETag or Last-Modified date still match get a 304
+response straight from the cache, without touching the database. Logged-in
+users, whose pages show their name, votes and messages, are never served
+from or stored in this cache.
+"""
+import functools
+import hashlib
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .cache import current_version, results_version
+from .routers import use_primary
+
+CONTENT_VERSION_KEY = 'polls:content-version'
+PAGE_KEY = 'polls:page:{digest}'
+
+
+def content_version():
+    """Return the current version of the questions."""
+    return current_version(CONTENT_VERSION_KEY)
+
+
+def invalidate_content():
+    """Make the cached pages that list or show questions stale."""
+    cache.set(CONTENT_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def index_version(request, *args, **kwargs):
+    period = int(time.time() // settings.POLLS_PAGE_CACHE_TIMEOUT)
+    return f'{content_version()}:{period}'
+
+
+def results_page_version(request, pk, *args, **kwargs):
+    return f'{content_version()}:{results_version(pk)}'
+
+
+def is_anonymous(request):
+    """
+    Return True for requests that carry no session or messages cookie, and
+    so would get the same page as any other visitor.
+    """
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and 'messages' not in request.COOKIES)
+
+
+def cache_anonymous_page(get_version):
+    """
+    Decorate an async view so that its pages for anonymous visitors are
+    cached under the version returned by `get_version`, which is called
+    with the view's arguments.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not is_anonymous(request):
+                return await view(request, *args, **kwargs)
+            version = await sync_to_async(get_version)(request, *args,
+                                                       **kwargs)
+            digest = hashlib.md5(
+                f'{request.get_full_path()}:{version}'.encode()).hexdigest()
+            key = PAGE_KEY.format(digest=digest)
+
+            response = await cache.aget(key)
+            if response is None:
+                # Served to everybody until it expires, so not from a
+                # replica that may lag behind.
+                with use_primary():
+                    response = await view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                response['ETag'] = f'"{digest}"'
+                response['Last-Modified'] = http_date()
+                patch_vary_headers(response, ['Cookie'])
+                if hasattr(response, 'render'):
+                    response.add_post_render_callback(
+                        lambda rendered: _store(key, rendered))
+                else:
+                    _store(key, response)
+
+            return get_conditional_response(
+                request,
+                etag=response['ETag'],
+                last_modified=parse_http_date_safe(response['Last-Modified']),
+                response=response,
+            )
+        return wrapper
+    return decorator
+
+
+def _store(key, response):
+    # Never share a response that sets cookies.
+    if not response.cookies:
+        cache.set(key, response, settings.POLLS_PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,141 @@
+"""
+Rate limiting of the vote and login endpoints with token buckets.
+
+Each client IP and each user has a bucket per scope, stored in the cache.
+A bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+second, as set for the scope in ``POLLS_RATE_LIMITS``. Every limited request
+takes a token from each of its buckets. A request that finds a bucket empty
+gets a 429 response before the view runs, so a flood costs no database
+writes and no password hashing.
+
+The user of a vote is the id stored in the session; the user of a login is
+the submitted username, so that guessing one account's password from many
+addresses is limited too. Reading and writing a bucket are separate cache
+operations, so concurrent requests may occasionally share a token.
+
+The client IP is the address of the connection, unless that address is
+one of POLLS_TRUSTED_PROXIES. Then it is the last X-Forwarded-For address
+that was not added by a trusted proxy, since clients can write whatever
+they like at the start of that header. The buckets are only shared by all
+workers when the cache is (see CACHE_BACKEND in mysite/settings.py).
+"""
+import functools
+import hashlib
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .cache import increment
+
+BUCKET_KEY = 'polls:ratelimit:{scope}:{kind}:{digest}'
+REJECTED_KEY = 'polls:ratelimit-rejected:{scope}:{kind}'
+KINDS = ('ip', 'user')
+
+
+def take_token(key, burst, rate):
+    """
+    Take a token from the bucket stored under `key`. Return 0 if one was
+    taken, or else the seconds until the bucket has a token again.
+    """
+    now = time.time()
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # A bucket that expires is simply full again.
+    cache.set(key, (tokens - 1, now), math.ceil(burst / rate))
+    return 0
+
+
+def client_ip(request):
+    """
+    Return the address of the client that sent `request`, trusting only the
+    X-Forwarded-For entries added by POLLS_TRUSTED_PROXIES.
+    """
+    ip = request.META.get('REMOTE_ADDR', '')
+    proxies = settings.POLLS_TRUSTED_PROXIES
+    if ip in proxies:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        for address in reversed(forwarded.split(',')):
+            address = address.strip()
+            if not address:
+                continue
+            ip = address
+            if ip not in proxies:
+                break
+    return ip
+
+
+def request_identities(request, scope):
+    """Return the (kind, value) pairs that `request` is limited by."""
+    identities = [('ip', client_ip(request))]
+    if scope == 'login':
+        user = request.POST.get('username')
+    else:
+        user = request.session.get(SESSION_KEY)
+    if user:
+        identities.append(('user', str(user)))
+    return identities
+
+
+def check_rate(request, scope):
+    """
+    Take a token from each bucket of `request` in `scope`. Return None if
+    the request may go ahead, or else the seconds it should wait.
+    """
+    limit = settings.POLLS_RATE_LIMITS[scope]
+    for kind, value in request_identities(request, scope):
+        digest = hashlib.md5(value.encode()).hexdigest()
+        wait = take_token(
+            BUCKET_KEY.format(scope=scope, kind=kind, digest=digest),
+            limit['burst'], limit['rate'])
+        if wait:
+            increment(REJECTED_KEY.format(scope=scope, kind=kind))
+            return wait
+    return None
+
+
+def too_many_requests(wait):
+    response = HttpResponse("Too many requests. Please try again later.\n",
+                            content_type='text/plain', status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope, methods=('POST',)):
+    """
+    Decorate a view, sync or async, so that its `methods` requests are
+    limited by the buckets of `scope`.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    wait = await sync_to_async(check_rate)(request, scope)
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    wait = check_rate(request, scope)
+                    if wait:
+                        return too_many_requests(wait)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rejection_counts():
+    """Return the number of rejected requests for each scope and kind."""
+    return {scope: {kind: cache.get(REJECTED_KEY.format(scope=scope,
+                                                        kind=kind), 0)
+                    for kind in KINDS}
+            for scope in settings.POLLS_RATE_LIMITS}
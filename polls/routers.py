@@ -0,0 +1,91 @@
+"""
+Routing of poll reads to read replicas.
+
+POLLS_READ_REPLICAS lists the database aliases that replicate the primary,
+"default". Reads of the polls models go to one of them at random. Writes,
+reads of other apps and reads inside a transaction on the primary stay on
+the primary.
+
+Replicas lag behind the primary. A user who just voted is sent a cookie
+that, for POLLS_PRIMARY_STICKY_SECONDS, makes StickToPrimaryMiddleware
+send all of their reads to the primary, so they never see results that
+miss their vote. Code that fills a shared cache wraps itself in
+use_primary() for the same reason: a stale read would be served to
+everybody until the cache expires.
+"""
+import contextlib
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_COOKIE = 'polls_primary'
+
+_use_primary = contextvars.ContextVar('polls_use_primary', default=False)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Send the reads of the block to the primary database."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """Send reads of the polls models to the replicas, writes to primary."""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.POLLS_READ_REPLICAS
+        if (not replicas or model._meta.app_label != 'polls'
+                or _use_primary.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Without an answer, Django would save an instance to the database
+        # it was read from, which may be a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
+
+
+def stick_to_primary(response):
+    """Make the user's next requests read from the primary for a while."""
+    response.set_cookie(PRIMARY_COOKIE, '1',
+                        max_age=settings.POLLS_PRIMARY_STICKY_SECONDS,
+                        httponly=True, samesite='Lax')
+    return response
+
+
+class StickToPrimaryMiddleware:
+    """Read from the primary for requests that carry the primary cookie."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if PRIMARY_COOKIE not in request.COOKIES:
+            return self.get_response(request)
+        with use_primary():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if PRIMARY_COOKIE not in request.COOKIES:
+            return await self.get_response(request)
+        with use_primary():
+            return await self.get_response(request)
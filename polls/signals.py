@@ -0,0 +1,71 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import forget_final_results, forget_votes, invalidate_results
+from .models import (ArchivedVote, Choice, Question, ResultsSnapshot, Vote,
+                     VoteCounter, counter_shard)
+from .pagecache import invalidate_content
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """Make cached pages stale when a question is added, edited or deleted."""
+    invalidate_content()
+
+
+@receiver(post_save, sender=Question)
+def question_reopened(sender, instance, created, **kwargs):
+    """
+    Drop the results snapshot of a closed poll that was reopened, and bring
+    back its archived votes.
+    """
+    if not created and not instance.is_closed():
+        ResultsSnapshot.objects.filter(question=instance).delete()
+        forget_final_results(instance.pk)
+        ArchivedVote.objects.restore(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    """Make cached results stale when a choice is edited or deleted."""
+    invalidate_results(instance.question_id)
+
+
+@receiver([post_save, post_delete], sender=Vote)
+def vote_changed(sender, instance, **kwargs):
+    """
+    Make the cached vote map of a user stale when one of their votes is
+    saved or deleted other than through Vote.objects.record().
+    """
+    forget_votes(instance.user_id)
+
+
+@receiver(post_save, sender=Vote)
+def vote_created(sender, instance, created, raw, **kwargs):
+    """
+    Count a vote created other than through Vote.objects.record(), which
+    counts its votes itself. Votes loaded from fixtures are counted by
+    rebuild_vote_counts.
+    """
+    if created and not raw:
+        _count_vote(instance, 1)
+        invalidate_results(instance.question_id)
+
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Uncount a deleted vote, unless its choice or poll goes with it. Bulk
+    deletes of votes adjust the counters themselves, as
+    ArchivedVote.objects.archive() does.
+    """
+    if isinstance(origin, (Choice, Question)) or getattr(
+            origin, 'model', None) in (Choice, Question, Vote):
+        return
+    _count_vote(instance, -1)
+    invalidate_results(instance.question_id)
+
+
+def _count_vote(vote, delta):
+    VoteCounter.objects.add({(vote.question_id, vote.choice_id,
+                              counter_shard(vote.user_id)): delta})
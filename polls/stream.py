@@ -0,0 +1,161 @@
+"""
+Live results as server-sent events.
+
+Every question that somebody is watching has one ResultsBroadcaster. It
+checks the question's results version every ``POLLS_STREAM_POLL_INTERVAL``
+seconds, reloads the tallies only when the version changed, and pushes the
+changed counts to all subscribers. The number of watchers therefore does not
+change the number of database queries.
+
+Each subscriber has a bounded queue. A subscriber that falls behind has its
+queue replaced with a fresh snapshot instead of slowing down the others.
+The broadcaster stops when its last subscriber leaves, and each stream ends
+after ``POLLS_STREAM_MAX_AGE`` seconds so that idle browsers reconnect.
+
+Streams are only served through ASGI. Under WSGI, Django buffers an async
+streaming response whole, so the browser would get nothing until the stream
+ended, and each request would run in an event loop of its own, while the
+broadcasters and their queues belong to the one loop of an ASGI worker.
+Votes handled by other workers change the results version in the shared
+cache that several workers require (see gunicorn.conf.py).
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .cache import get_results, results_version
+
+logger = logging.getLogger('polls')
+
+
+class ResultsBroadcaster:
+    """Fan out the results of one question to many subscribers."""
+
+    def __init__(self, question, poll_interval, queue_size):
+        self.question = question
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.results = None
+        self._version = None
+        self._task = None
+
+    def subscribe(self):
+        """Return a queue that receives the events of this question."""
+        queue = asyncio.Queue(self.queue_size)
+        if self.results is not None:
+            queue.put_nowait(('snapshot', self.results))
+        self.subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def refresh(self):
+        """Reload the results if they changed and publish the difference."""
+        version = await sync_to_async(results_version)(self.question.pk)
+        if version == self._version:
+            return
+        results = await sync_to_async(get_results)(self.question)
+        previous, self.results, self._version = self.results, results, version
+        if previous is None or _layout(previous) != _layout(results):
+            self.publish('snapshot', results)
+            return
+        old_votes = {choice['id']: choice['votes']
+                     for choice in previous['choices']}
+        changed = {choice['id']: choice['votes']
+                   for choice in results['choices']
+                   if choice['votes'] != old_votes[choice['id']]}
+        if changed:
+            self.publish('delta', {'total_votes': results['total_votes'],
+                                   'choices': changed})
+
+    def publish(self, event, data):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Too slow to keep up: skip the backlog and resynchronise.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(('snapshot', self.results))
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    await self.refresh()
+                except Exception:
+                    logger.exception("Failed to refresh results of question %s",
+                                     self.question.pk)
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self._task = None
+            if _broadcasters.get(self.question.pk) is self:
+                del _broadcasters[self.question.pk]
+
+
+def _layout(results):
+    """Return the choices of `results` without their counts."""
+    return [(choice['id'], choice['choice_text'])
+            for choice in results['choices']]
+
+
+_broadcasters = {}
+
+
+def get_broadcaster(question):
+    """Return the broadcaster of `question`, creating it if needed."""
+    broadcaster = _broadcasters.get(question.pk)
+    if broadcaster is None:
+        broadcaster = ResultsBroadcaster(
+            question,
+            poll_interval=settings.POLLS_STREAM_POLL_INTERVAL,
+            queue_size=settings.POLLS_STREAM_QUEUE_SIZE,
+        )
+        _broadcasters[question.pk] = broadcaster
+    return broadcaster
+
+
+def can_stream(request):
+    """Return True if results can be streamed in answer to `request`."""
+    return isinstance(request, ASGIRequest)
+
+
+def format_event(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_results(question):
+    """
+    Yield the server-sent events for the results of `question` until the
+    client disconnects or the stream reaches its maximum age.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.POLLS_STREAM_MAX_AGE
+    broadcaster = get_broadcaster(question)
+    queue = broadcaster.subscribe()
+    try:
+        # Ask the browser to wait a little before reconnecting.
+        yield "retry: 3000\n\n"
+        while True:
+            timeout = min(settings.POLLS_STREAM_HEARTBEAT,
+                          deadline - loop.time())
+            if timeout <= 0:
+                break
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # A comment line keeps proxies from closing the connection.
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event, data)
+    finally:
+        broadcaster.unsubscribe(queue)
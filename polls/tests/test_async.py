@@ -0,0 +1,109 @@
+import contextvars
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+
+
+class AsyncViewTests(TestCase):
+    """The polls views served the way an ASGI server runs them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = Question.objects.create(
+            question_text="Async question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        cls.choice = Choice.objects.create(question=cls.question,
+                                           choice_text="Async choice.")
+        cls.user = User.objects.create_user(username='voter',
+                                            password='password')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_index(self):
+        """The index lists published questions."""
+        response = await self.async_client.get(reverse('polls:index'))
+        self.assertContains(response, "Async question.")
+
+    async def test_detail_shows_previous_vote(self):
+        """The detail page preselects the logged-in user's earlier vote."""
+        await Vote.objects.acreate(user=self.user, question=self.question,
+                                   choice=self.choice)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('polls:detail', args=(self.question.id,)))
+        self.assertEqual(response.context['user_vote'], self.choice.id)
+        self.assertContains(response, "Log Out")
+
+    async def test_vote_and_results(self):
+        """
+        A vote is recorded, confirmed with a message and shown in the results.
+        """
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=(self.question.id,)),
+            {'choice': self.choice.id})
+        results_url = reverse('polls:results', args=(self.question.id,))
+        self.assertRedirects(response, results_url,
+                             fetch_redirect_response=False)
+        self.assertEqual(await Vote.objects.filter(user=self.user).acount(), 1)
+
+        response = await self.async_client.get(results_url)
+        self.assertEqual(response.context['total_votes'], 1)
+        messages = [str(message) for message in response.context['messages']]
+        self.assertEqual(messages, ["You voted for 'Async choice.'"])
+
+    async def test_vote_without_choice(self):
+        """A vote without a choice redisplays the form with an error."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=(self.question.id,)))
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+        self.assertContains(response, "Async choice.")
+
+    async def test_live_results_only_through_asgi(self):
+        """
+        Results pages served through ASGI stream live tallies; through WSGI
+        they neither offer nor serve the stream.
+        """
+        results_url = reverse('polls:results', args=(self.question.id,))
+        stream_url = reverse('polls:results_stream', args=(self.question.id,))
+        self.assertContains(await self.async_client.get(results_url),
+                            "EventSource")
+        cache.clear()
+        self.assertNotContains(await sync_to_async(self.client.get)(results_url),
+                               "EventSource")
+        response = await sync_to_async(self.client.get)(stream_url)
+        self.assertEqual(response.status_code, 204)
+
+
+class WsgiContextTests(TestCase):
+    """The async views run through WSGI, in one worker thread."""
+
+    def test_context_does_not_grow(self):
+        """
+        Requests leave no context variables behind in the worker thread,
+        which would make every later request slower.
+        """
+        question = Question.objects.create(
+            question_text="WSGI question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        choice = Choice.objects.create(question=question,
+                                       choice_text="WSGI choice.")
+        self.client.force_login(User.objects.create_user(username='voter'))
+        detail_url = reverse('polls:detail', args=(question.id,))
+        vote_url = reverse('polls:vote', args=(question.id,))
+        sizes = []
+        for i in range(10):
+            self.client.get(detail_url)
+            self.client.post(vote_url)
+            self.client.post(vote_url, {'choice': choice.id})
+            sizes.append(len(contextvars.copy_context()))
+        self.assertEqual(len(set(sizes[1:])), 1, sizes)
@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 
@@ -84,3 +84,41 @@ class UserAuthenticationTests(TestCase):
         # Verifying redirection to the login page with the next parameter
         login_redirect_url = f"{reverse('login')}?next={vote_url}"
         self.assertRedirects(response, login_redirect_url)
+
+
+PBKDF2 = 'mysite.hashers.PBKDF2PasswordHasher'
+SCRYPT = 'mysite.hashers.ScryptPasswordHasher'
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000,
+                   PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10)
+class PasswordUpgradeTests(TestCase):
+    def setUp(self):
+        with override_settings(PASSWORD_HASHERS=[PBKDF2, SCRYPT]):
+            self.user = User.objects.create_user(username='upgraded',
+                                                 password='SecurePass!')
+
+    def log_in(self):
+        response = self.client.post(reverse('login'), {
+            'username': 'upgraded', 'password': 'SecurePass!'})
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+
+    def test_new_cost_is_applied_at_login(self):
+        """
+        Raising the PBKDF2 iterations re-hashes the password at the next
+        login.
+        """
+        with override_settings(PASSWORD_HASHERS=[PBKDF2, SCRYPT],
+                               PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.log_in()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_new_hasher_is_applied_at_login(self):
+        """
+        Choosing another hasher re-hashes older hashes at the next login.
+        """
+        with override_settings(PASSWORD_HASHERS=[SCRYPT, PBKDF2]):
+            self.log_in()
+            self.assertTrue(self.user.check_password('SecurePass!'))
+        self.assertTrue(self.user.password.startswith('scrypt$'))
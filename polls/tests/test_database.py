@@ -0,0 +1,63 @@
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase
+
+from polls.models import Question
+
+
+class SQLiteSettingsTests(SimpleTestCase):
+    """The SQLite connection settings, checked against a file database."""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite settings only")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(connection.settings_dict,
+                             NAME=os.path.join(directory.name, 'db.sqlite3'))
+        self.wrapper = DatabaseWrapper(settings_dict, alias='sqlite-settings')
+        self.addCleanup(self.wrapper.close)
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_wal_journal(self):
+        """Connections use write-ahead logging."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+
+    def test_synchronous_normal(self):
+        """Commits are synced with synchronous=NORMAL (1)."""
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_busy_timeout(self):
+        """Connections wait for locks instead of failing at once."""
+        self.assertGreater(self.pragma('busy_timeout'), 0)
+
+    def test_immediate_transactions(self):
+        """Transactions take the write lock when they begin."""
+        self.wrapper.ensure_connection()
+        self.assertEqual(self.wrapper.transaction_mode, 'IMMEDIATE')
+
+
+class ExplainHotpathsTests(TestCase):
+    def test_seeded_plans_use_indexes(self):
+        """
+        explain_hotpaths prints a plan for each hot query against a dataset
+        that it rolls back afterwards.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest("Checks SQLite query plans")
+        stdout = io.StringIO()
+        call_command('explain_hotpaths', '--seed', '--questions', '50',
+                     '--users', '20', '--votes-per-user', '5', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('polls_question_pub_id_idx', output)
+        self.assertIn('polls_vote_question_id_idx', output)
+        self.assertFalse(Question.objects.exists())
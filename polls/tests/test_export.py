@@ -0,0 +1,98 @@
+import datetime
+import io
+import json
+import warnings
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = Question.objects.create(
+            question_text="Exported question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        cls.choice1 = Choice.objects.create(question=cls.question,
+                                            choice_text="Choice 1.")
+        cls.choice2 = Choice.objects.create(question=cls.question,
+                                            choice_text="Choice 2.")
+        cls.users = [User.objects.create_user(username=f'user{i}')
+                     for i in range(3)]
+        for user in cls.users:
+            Vote.objects.record(user, cls.choice1)
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+
+    def test_results_csv(self):
+        """
+        The CSV export has one row per choice with its votes and percentage.
+        """
+        response = self.client.get(reverse('polls:results_csv',
+                                           args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response.content.decode().splitlines(), [
+            'choice_id,choice_text,votes,percentage',
+            f'{self.choice1.id},Choice 1.,3,100.0',
+            f'{self.choice2.id},Choice 2.,0,0.0',
+        ])
+
+    def test_vote_dump_requires_staff(self):
+        """
+        Only staff can export the individual votes.
+        """
+        url = reverse('polls:results_jsonl', args=(self.question.id,))
+        self.client.force_login(self.users[0])
+        response = self.client.get(url, {'votes': ''})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_vote_dump_resumes_after_cursor(self):
+        """
+        The streamed vote dump starts after the vote id given as cursor.
+        """
+        votes = [vote async for vote in Vote.objects.order_by('id')]
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(
+            reverse('polls:results_jsonl', args=(self.question.id,)),
+            {'votes': '', 'after': votes[0].id})
+        self.assertTrue(response.streaming)
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([row['id'] for row in lines],
+                         [vote.id for vote in votes[1:]])
+        self.assertEqual(lines[0]['choice_id'], self.choice1.id)
+
+    def test_vote_dump_streams_through_wsgi(self):
+        """
+        Through WSGI the vote dump is streamed from a synchronous iterator,
+        which Django does not have to collect into a list first.
+        """
+        self.client.force_login(self.staff)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = self.client.get(
+                reverse('polls:results_csv', args=(self.question.id,)),
+                {'votes': ''})
+            # Iterate the response as the WSGI server does.
+            lines = b''.join(response).decode().splitlines()
+        self.assertFalse([warning for warning in caught
+                          if 'asynchronous iterators' in str(warning.message)])
+        self.assertEqual(lines[0], 'id,question_id,choice_id,user_id')
+        self.assertEqual(len(lines), 4)
+
+    def test_export_votes_command(self):
+        """
+        export_votes writes one row per vote, or per choice with --aggregate.
+        """
+        stdout = io.StringIO()
+        call_command('export_votes', '--chunk-size', '2', stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 4)
+
+        stdout = io.StringIO()
+        call_command('export_votes', self.question.id, '--aggregate',
+                     '--format', 'jsonl', stdout=stdout)
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([row['votes'] for row in rows], [3, 0])
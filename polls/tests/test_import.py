@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from polls.management.commands.import_polls import iter_objects
+from polls.models import Question, Choice, Vote
+
+
+class ImportPollsTests(TestCase):
+    def import_polls(self, *paths, **options):
+        call_command('import_polls', *paths, stdout=io.StringIO(), **options)
+
+    def write_jsonl(self, objects):
+        """Write `objects` as JSON Lines to a temporary file."""
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as stream:
+            for obj in objects:
+                stream.write(json.dumps(obj) + '\n')
+        return path
+
+    def test_import_is_idempotent(self):
+        """
+        Importing the same fixtures again skips the rows already present.
+        """
+        paths = ['data/polls-v4.json', 'data/users.json', 'data/votes-v4.json']
+        self.import_polls(*paths, batch_size=5)
+        counts = (Question.objects.count(), Choice.objects.count(),
+                  User.objects.count(), Vote.objects.count())
+        self.import_polls(*paths, batch_size=5)
+        self.assertEqual((Question.objects.count(), Choice.objects.count(),
+                          User.objects.count(), Vote.objects.count()), counts)
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_legacy_votes_field(self):
+        """
+        The old ‘votes’ counter of choices in polls-v2.json is kept as the
+        choices' vote count, and not reset by the rebuild.
+        """
+        out = io.StringIO()
+        call_command('import_polls', 'data/polls-v2.json', stdout=out)
+        self.assertIn("Kept the legacy vote counts of 4 choices", out.getvalue())
+        self.assertEqual(Choice.objects.get(pk=6).votes, 1)
+        self.assertEqual(Choice.objects.get(pk=5).votes, 0)
+        with open('data/polls-v2.json', encoding='utf-8') as stream:
+            legacy = {obj['pk']: obj['fields']['votes']
+                      for obj in json.load(stream)
+                      if obj['model'] == 'polls.choice'}
+        self.assertEqual(sum(choice.votes for choice in Choice.objects.all()),
+                         sum(legacy.values()))
+        question = Choice.objects.get(pk=6).question
+        self.assertEqual(question.vote_count, question.total_votes)
+
+    def test_votes_without_question(self):
+        """
+        Votes that only name a choice get its question, and the vote counters
+        of the imported polls are rebuilt.
+        """
+        path = self.write_jsonl([
+            {'model': 'polls.question', 'pk': 1,
+             'fields': {'question_text': "Imported?",
+                        'pub_date': '2024-01-01T00:00:00Z'}},
+            {'model': 'polls.choice', 'pk': 1,
+             'fields': {'question': 1, 'choice_text': "Yes"}},
+            {'model': 'auth.user', 'pk': 1,
+             'fields': {'username': 'voter', 'password': ''}},
+            {'model': 'polls.vote', 'pk': 1,
+             'fields': {'choice': 1, 'user': 1}},
+        ])
+        self.import_polls(path)
+        self.assertEqual(Vote.objects.get().question_id, 1)
+        self.assertEqual(Choice.objects.get().votes, 1)
+        self.assertEqual(Question.objects.get().vote_count, 1)
+
+    def test_iter_objects_reads_in_chunks(self):
+        """
+        Objects that span several reads are parsed from arrays and lines.
+        """
+        objects = [{'pk': i, 'text': 'x' * 50} for i in range(20)]
+        for text in (json.dumps(objects, indent=2),
+                     '\n'.join(json.dumps(obj) for obj in objects)):
+            parsed = list(iter_objects(io.StringIO(text), chunk_size=16))
+            self.assertEqual(parsed, objects)
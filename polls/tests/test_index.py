@@ -1,4 +1,6 @@
 from polls.models import Question
+from polls.views import IndexView
+from django.core.cache import cache
 from django.utils import timezone
 from django.test import TestCase
 from django.urls import reverse
@@ -16,6 +18,10 @@ def create_question(question_text, days):
 
 
 class QuestionIndexViewTests(TestCase):
+    def setUp(self):
+        # Pages cached for anonymous visitors outlive each test's data.
+        cache.clear()
+
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -70,4 +76,64 @@ class QuestionIndexViewTests(TestCase):
         self.assertQuerySetEqual(
             response.context["latest_question_list"],
             [question2, question1],
-        )
\ No newline at end of file
+        )
+
+
+class QuestionIndexPaginationTests(TestCase):
+    def setUp(self):
+        # Pages cached for anonymous visitors outlive each test's data.
+        cache.clear()
+
+    def test_first_page_is_limited(self):
+        """
+        The index shows at most one page of questions and links to the next.
+        """
+        page_size = IndexView.page_size
+        for i in range(page_size + 1):
+            create_question(question_text=f"Question {i}.", days=-i - 1)
+        response = self.client.get(reverse("polls:index"))
+        questions = response.context["latest_question_list"]
+        self.assertEqual(len(questions), page_size)
+        self.assertIsNotNone(response.context["next_cursor"])
+        self.assertContains(response, "Older polls")
+
+    def test_next_page_continues_after_cursor(self):
+        """
+        Following the cursor shows the remaining questions, including ones
+        that share a pub_date with the last question of the previous page.
+        """
+        page_size = IndexView.page_size
+        time = timezone.now() - datetime.timedelta(days=1)
+        Question.objects.bulk_create(
+            Question(question_text=f"Question {i}.", pub_date=time)
+            for i in range(page_size + 5))
+        response = self.client.get(reverse("polls:index"))
+        first_page = list(response.context["latest_question_list"])
+        response = self.client.get(reverse("polls:index"),
+                                   {"after": response.context["next_cursor"]})
+        second_page = list(response.context["latest_question_list"])
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertCountEqual(first_page + second_page, Question.objects.all())
+
+    def test_invalid_cursor_shows_first_page(self):
+        """
+        A malformed cursor is ignored and the first page is shown.
+        """
+        question = create_question(question_text="Past question.", days=-1)
+        response = self.client.get(reverse("polls:index"), {"after": "bogus"})
+        self.assertQuerySetEqual(response.context["latest_question_list"],
+                                 [question])
+
+    def test_open_and_closed_status(self):
+        """
+        Each question is annotated with whether it is open for voting.
+        """
+        open_question = create_question(question_text="Open.", days=-2)
+        closed_question = create_question(question_text="Closed.", days=-3)
+        closed_question.end_date = timezone.now() - datetime.timedelta(days=1)
+        closed_question.save()
+        response = self.client.get(reverse("polls:index"))
+        self.assertEqual(
+            [(q, q.is_open) for q in response.context["latest_question_list"]],
+            [(open_question, True), (closed_question, False)])
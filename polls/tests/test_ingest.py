@@ -0,0 +1,93 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.ingest import VoteQueue
+from polls.models import Question, Choice, Vote
+
+
+class VoteQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Queued question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 1.")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 2.")
+        self.user = User.objects.create_user(username='voter',
+                                             password='password')
+        # A long interval keeps the background thread from flushing, so the
+        # tests decide when votes are written.
+        self.queue = VoteQueue(flush_interval=3600, batch_size=1000)
+        self.addCleanup(self.queue.stop)
+        patcher = mock.patch('polls.ingest._vote_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_votes_are_coalesced(self):
+        """
+        Only the latest queued vote of a user in a poll is written.
+        """
+        self.queue.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.queue.submit(self.user.pk, self.question.pk, self.choice2.pk)
+        self.assertEqual(self.queue.flush(), 1)
+        vote = Vote.objects.get(user=self.user, question=self.question)
+        self.assertEqual(vote.choice, self.choice2)
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+
+    def test_stop_drains_queue(self):
+        """
+        Stopping the queue writes the votes that are still waiting.
+        """
+        self.queue.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.queue.stop()
+        self.assertTrue(Vote.objects.filter(user=self.user,
+                                            choice=self.choice1).exists())
+
+    @override_settings(POLLS_VOTE_INGESTION='queue')
+    def test_vote_view_queues_vote(self):
+        """
+        In queue mode the vote view does not write the vote, but the voter
+        sees it on the detail and results pages.
+        """
+        self.client.force_login(self.user)
+        self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                         {'choice': self.choice1.id})
+        self.assertFalse(Vote.objects.exists())
+
+        response = self.client.get(reverse('polls:detail',
+                                           args=(self.question.id,)))
+        self.assertEqual(response.context['user_vote'], self.choice1.id)
+
+        with self.assertNumQueries(5):
+            # The session, the user, the question, the tallies and the
+            # user's vote map; the queued vote is not written.
+            response = self.client.get(reverse('polls:results',
+                                               args=(self.question.id,)))
+        self.assertEqual(response.context['total_votes'], 1)
+        self.assertFalse(Vote.objects.exists())
+
+    @override_settings(POLLS_VOTE_INGESTION='queue')
+    def test_results_move_changed_vote(self):
+        """
+        A queued vote that changes the voter's written vote is moved from
+        the old choice to the new one in the voter's results.
+        """
+        Vote.objects.record(self.user, self.choice1)
+        self.client.force_login(self.user)
+        self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                         {'choice': self.choice2.id})
+        response = self.client.get(reverse('polls:results',
+                                           args=(self.question.id,)))
+        self.assertEqual(response.context['total_votes'], 1)
+        self.assertEqual([choice['votes']
+                          for choice in response.context['choices']], [0, 1])
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
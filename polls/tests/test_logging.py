@@ -0,0 +1,97 @@
+import datetime
+import json
+import logging
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.log import BoundedQueueHandler, JSONFormatter
+from polls.models import Question, Choice
+
+
+class SlowHandler(logging.Handler):
+    """A handler that stands in for a slow disk."""
+
+    def __init__(self, delay=0, gate=None):
+        super().__init__()
+        self.delay = delay
+        self.gate = gate
+        self.records = []
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        time.sleep(self.delay)
+        self.records.append(record)
+
+
+class QueueLoggingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def attach(self, handler):
+        logger = logging.getLogger('polls')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.stop)
+
+    def test_slow_sink_does_not_delay_requests(self):
+        """
+        A vote returns without waiting for a log handler that takes half a
+        second, and the record is written afterwards.
+        """
+        question = Question.objects.create(
+            question_text="Logged question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        choice = Choice.objects.create(question=question,
+                                       choice_text="Logged choice.")
+        self.client.force_login(User.objects.create_user(username='voter'))
+        slow = SlowHandler(delay=0.5)
+        queue_handler = BoundedQueueHandler([slow])
+        self.attach(queue_handler)
+
+        start = time.perf_counter()
+        self.client.post(reverse('polls:vote', args=(question.id,)),
+                         {'choice': choice.id})
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+        queue_handler.stop()
+        self.assertEqual(slow.records[0].getMessage(),
+                         "User voter voted for choice Logged choice. "
+                         "for question %s" % question.id)
+
+    def test_full_queue_drops_records(self):
+        """
+        Records that do not fit in the queue are counted and dropped.
+        """
+        gate = threading.Event()
+        blocked = SlowHandler(gate=gate)
+        queue_handler = BoundedQueueHandler([blocked], maxsize=2)
+        self.attach(queue_handler)
+        logger = logging.getLogger('polls')
+        for number in range(10):
+            logger.warning("Record %d", number)
+        gate.set()
+        queue_handler.stop()
+        self.assertGreaterEqual(queue_handler.dropped, 7)
+        self.assertEqual(len(blocked.records) + queue_handler.dropped, 10)
+
+
+class JSONFormatterTests(SimpleTestCase):
+    def test_extra_fields(self):
+        """
+        Records are formatted as JSON with their `extra` fields.
+        """
+        record = logging.makeLogRecord({
+            'name': 'polls', 'levelname': 'INFO', 'msg': "User %s voted",
+            'args': ('voter',), 'question': 3,
+        })
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['message'], "User voter voted")
+        self.assertEqual(entry['question'], 3)
+        self.assertEqual(entry['level'], 'INFO')
@@ -0,0 +1,62 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.metrics import registry
+from polls.models import Question, Choice
+
+
+@override_settings(SERVER_TIMING=True)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = Question.objects.create(
+            question_text="Measured question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        Choice.objects.create(question=cls.question, choice_text="Choice.")
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def test_server_timing_counts_queries(self):
+        """
+        The Server-Timing header reports the queries the view ran.
+        """
+        url = reverse('polls:results', args=(self.question.id,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    async def test_async_requests_are_measured(self):
+        """
+        Queries run by async views in other threads are counted, and each
+        view has its own histograms.
+        """
+        url = reverse('polls:detail', args=(self.question.id,))
+        await self.async_client.get(url)
+        await self.async_client.get(url)
+        histograms = registry.snapshot()['polls:detail']
+        self.assertEqual(histograms['total_ms']['count'], 2)
+        # The question and its choices.
+        self.assertEqual(histograms['queries']['sum'], 4)
+        self.assertGreater(histograms['template_ms']['sum'], 0)
+
+    def test_metrics_endpoint_requires_staff(self):
+        """
+        Only staff can read the histograms.
+        """
+        self.client.get(reverse('polls:index'))
+        response = self.client.get(reverse('request_metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('request_metrics'))
+        self.assertIn('polls:index', response.json()['views'])
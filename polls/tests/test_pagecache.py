@@ -0,0 +1,80 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+
+
+def create_question(question_text, days=-1):
+    return Question.objects.create(
+        question_text=question_text,
+        pub_date=timezone.now() + datetime.timedelta(days=days))
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question("Cached question.")
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text="Cached choice.")
+        self.results_url = reverse('polls:results', args=(self.question.id,))
+
+    def test_repeat_index_is_served_from_cache(self):
+        """
+        A second anonymous view of the index runs no queries and carries
+        the same ETag.
+        """
+        first = self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('polls:index'))
+        self.assertContains(second, "Cached question.")
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Cookie', second['Vary'])
+
+    def test_matching_etag_gets_not_modified(self):
+        """
+        A conditional GET with the current ETag gets a 304 without queries.
+        """
+        etag = self.client.get(self.results_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.results_url,
+                                       headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_new_question_changes_index(self):
+        """
+        Publishing a question makes the cached index stale.
+        """
+        etag = self.client.get(reverse('polls:index'))['ETag']
+        create_question("Fresh question.")
+        response = self.client.get(reverse('polls:index'),
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Fresh question.")
+
+    def test_vote_changes_results(self):
+        """
+        A recorded vote makes the cached results page stale.
+        """
+        etag = self.client.get(self.results_url)['ETag']
+        voter = User.objects.create_user(username='voter')
+        Vote.objects.record(voter, self.choice)
+        response = self.client.get(self.results_url,
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Total votes: <span id="total-votes">1</span>')
+
+    def test_logged_in_pages_are_not_cached(self):
+        """
+        Logged-in users get their own page, not the cached anonymous one.
+        """
+        self.client.get(reverse('polls:index'))
+        self.client.force_login(User.objects.create_user(username='voter'))
+        response = self.client.get(reverse('polls:index'))
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, "voter")
@@ -60,4 +60,39 @@ class QuestionPollTests(TestCase):
         """
         past_time = timezone.now() - datetime.timedelta(days=1)
         past_question = Question(pub_date=past_time)
-        self.assertTrue(past_question.is_published())
\ No newline at end of file
+        self.assertTrue(past_question.is_published())
+
+
+class QuestionStatusQuerySetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        day = datetime.timedelta(days=1)
+        cls.questions = {
+            'future': Question.objects.create(pub_date=cls.now + day),
+            'open': Question.objects.create(pub_date=cls.now - day),
+            'ending': Question.objects.create(pub_date=cls.now - day,
+                                              end_date=cls.now),
+            'ended': Question.objects.create(pub_date=cls.now - 2 * day,
+                                             end_date=cls.now - day),
+        }
+
+    def names(self, queryset):
+        return {name for name, question in self.questions.items()
+                if question in queryset}
+
+    def test_open_and_closed(self):
+        """
+        open() and closed() split the published questions at `now`.
+        """
+        self.assertEqual(self.names(Question.objects.open(self.now)),
+                         {'open', 'ending'})
+        self.assertEqual(self.names(Question.objects.closed(self.now)),
+                         {'ended'})
+
+    def test_with_status_matches_can_vote(self):
+        """
+        The is_open annotation agrees with can_vote() for the same `now`.
+        """
+        for question in Question.objects.with_status(self.now):
+            self.assertIs(question.is_open, question.can_vote(self.now))
@@ -0,0 +1,165 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import views
+from polls.models import Question, Choice, Vote
+from polls.ratelimit import rejection_counts
+
+LIMITS = {
+    'vote': {'burst': 2, 'rate': 0.01},
+    'login': {'burst': 2, 'rate': 0.01},
+}
+
+
+@override_settings(POLLS_RATE_LIMITS=LIMITS)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Limited question.",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 1.")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 2.")
+        self.user = User.objects.create_user(username='voter',
+                                             password='password')
+        self.vote_url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_flood_gets_429(self):
+        """
+        Votes beyond the burst get a 429 with Retry-After and are not
+        written.
+        """
+        self.client.force_login(self.user)
+        self.client.post(self.vote_url, {'choice': self.choice1.id})
+        self.client.post(self.vote_url, {'choice': self.choice2.id})
+        with self.assertNumQueries(1):
+            # Only the session is loaded.
+            response = self.client.post(self.vote_url,
+                                        {'choice': self.choice1.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        vote = Vote.objects.get(user=self.user, question=self.question)
+        self.assertEqual(vote.choice, self.choice2)
+        self.assertEqual(rejection_counts()['vote'], {'ip': 1, 'user': 0})
+
+    def test_users_are_limited_across_addresses(self):
+        """
+        A user voting from many addresses is limited by their own bucket.
+        """
+        self.client.force_login(self.user)
+        statuses = [
+            self.client.post(self.vote_url, {'choice': self.choice1.id},
+                             REMOTE_ADDR=f'10.0.0.{number}').status_code
+            for number in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(rejection_counts()['vote'], {'ip': 0, 'user': 1})
+
+    def test_login_guessing_is_limited(self):
+        """
+        Login attempts for one username are limited across addresses,
+        before the password is checked.
+        """
+        for number in range(2):
+            self.client.post(reverse('login'),
+                             {'username': 'voter', 'password': 'guess'},
+                             REMOTE_ADDR=f'10.0.0.{number}')
+        with mock.patch('django.contrib.auth.forms.authenticate') as check:
+            response = self.client.post(
+                reverse('login'), {'username': 'voter', 'password': 'guess'},
+                REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+        check.assert_not_called()
+        self.assertEqual(rejection_counts()['login'], {'ip': 0, 'user': 1})
+
+    def test_forwarded_for_is_not_trusted_by_default(self):
+        """
+        Clients cannot dodge the IP limit by rotating X-Forwarded-For and
+        usernames.
+        """
+        statuses = [
+            self.client.post(reverse('login'),
+                             {'username': f'user{number}', 'password': 'x'},
+                             HTTP_X_FORWARDED_FOR=f'10.0.1.{number}'
+                             ).status_code
+            for number in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(rejection_counts()['login'], {'ip': 1, 'user': 0})
+
+    @override_settings(POLLS_TRUSTED_PROXIES=['10.0.0.1'])
+    def test_forwarded_for_from_trusted_proxy(self):
+        """
+        Behind a trusted proxy, the client is the address the proxy added,
+        whatever the client put before it.
+        """
+        def login(number, forwarded_for):
+            return self.client.post(
+                reverse('login'),
+                {'username': f'user{number}', 'password': 'x'},
+                REMOTE_ADDR='10.0.0.1',
+                HTTP_X_FORWARDED_FOR=forwarded_for).status_code
+
+        statuses = [login(number, f'1.2.3.{number}') for number in range(3)]
+        self.assertEqual(statuses, [200, 200, 200])
+        statuses = [login(number, f'9.9.9.{number}, 1.2.3.9')
+                    for number in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_logout_is_logged_with_client_address(self):
+        """
+        Logins and logouts are logged with the address the rate limits use,
+        not one the client put in X-Forwarded-For.
+        """
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.5',
+                                       HTTP_X_FORWARDED_FOR='1.2.3.4')
+        request.session = self.client.session
+        request.user = self.user
+        with self.assertLogs('polls', 'INFO') as logs:
+            views.logout(request)
+        self.assertIn("User voter logged out from 10.0.0.5", logs.output[0])
+
+    def test_login_page_is_not_limited(self):
+        """
+        Only login attempts use up tokens, not views of the login form.
+        """
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('login')).status_code,
+                             200)
+
+    def test_repeated_vote_is_not_written(self):
+        """
+        Voting again for the same choice redirects without changing the
+        vote or the counters.
+        """
+        self.client.force_login(self.user)
+        self.client.post(self.vote_url, {'choice': self.choice1.id})
+        with mock.patch.object(Vote.objects, 'bulk_create') as write:
+            response = self.client.post(self.vote_url,
+                                        {'choice': self.choice1.id})
+        write.assert_not_called()
+        self.assertRedirects(response, reverse('polls:results',
+                                               args=(self.question.id,)))
+        self.assertIn("You already voted for 'Choice 1.'",
+                      [str(message) for message
+                       in get_messages(response.wsgi_request)])
+
+    def test_repeated_vote_with_stale_vote_map_is_written(self):
+        """
+        A vote that matches a stale cached vote map, such as one left
+        behind by a vote handled in another process, is still written.
+        """
+        self.client.force_login(self.user)
+        self.client.post(self.vote_url, {'choice': self.choice1.id})
+        # The vote is changed without updating this process's vote map.
+        Vote.objects.filter(user=self.user).update(choice=self.choice2)
+        self.client.post(self.vote_url, {'choice': self.choice1.id})
+        vote = Vote.objects.get(user=self.user, question=self.question)
+        self.assertEqual(vote.choice, self.choice1)
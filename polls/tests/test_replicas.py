@@ -0,0 +1,74 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote
+from polls.routers import PRIMARY_COOKIE
+
+
+@override_settings(POLLS_READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The primary and the replica hold the same poll with different texts,
+    so each page shows which database it was read from. The tests do not
+    run in a transaction, since reads in transactions go to the primary.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        pub_date = timezone.now() - datetime.timedelta(days=1)
+        for alias, text in [('default', "Primary"), ('replica', "Replica")]:
+            question = Question.objects.using(alias).create(
+                pk=1, question_text=f"{text} question.", pub_date=pub_date)
+            Choice.objects.using(alias).create(
+                pk=1, question=question, choice_text=f"{text} choice.")
+        self.user = User.objects.create_user(username='voter')
+        self.client.force_login(self.user)
+        self.detail_url = reverse('polls:detail', args=(1,))
+
+    def test_reads_go_to_replica(self):
+        """
+        Poll pages are read from the replica.
+        """
+        response = self.client.get(self.detail_url)
+        self.assertContains(response, "Replica question.")
+
+    def test_writes_go_to_primary(self):
+        """
+        A vote is written to the primary only.
+        """
+        self.client.post(reverse('polls:vote', args=(1,)), {'choice': 1})
+        self.assertTrue(Vote.objects.using('default')
+                        .filter(user=self.user).exists())
+        self.assertFalse(Vote.objects.using('replica').exists())
+
+    def test_voter_reads_from_primary(self):
+        """
+        After voting, the voter's reads go to the primary, and other users'
+        reads still go to the replica.
+        """
+        response = self.client.post(reverse('polls:vote', args=(1,)),
+                                    {'choice': 1})
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        response = self.client.get(self.detail_url)
+        self.assertContains(response, "Primary question.")
+
+        self.client.cookies.pop(PRIMARY_COOKIE)
+        response = self.client.get(self.detail_url)
+        self.assertContains(response, "Replica question.")
+
+    def test_reads_in_transaction_go_to_primary(self):
+        """
+        Reads inside a transaction see the primary's rows.
+        """
+        with transaction.atomic():
+            question = Question.objects.get(pk=1)
+        self.assertEqual(question.question_text, "Primary question.")
+        self.assertEqual(Question.objects.get(pk=1).question_text,
+                         "Replica question.")
@@ -0,0 +1,247 @@
+import datetime
+import io
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.ingest import VoteQueue
+from polls.models import (ArchivedVote, Question, Choice, ResultsSnapshot,
+                          Vote)
+
+
+def create_poll(num_choices):
+    """
+    Create a published question with `num_choices` choices.
+    """
+    question = Question.objects.create(
+        question_text=f"Poll with {num_choices} choices.",
+        pub_date=timezone.now() - datetime.timedelta(days=1))
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for i in range(num_choices))
+    return question
+
+
+class ResultsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_tallies_and_percentages(self):
+        """
+        The results page shows each choice's votes, its percentage of the
+        total, and the total number of votes.
+        """
+        question = create_poll(2)
+        first, second = question.choice_set.order_by('pk')
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}')
+            Vote.objects.create(user=user, choice=first if i else second)
+
+        response = self.client.get(reverse('polls:results', args=(question.id,)))
+        self.assertEqual(response.context['total_votes'], 3)
+        self.assertEqual(
+            [(choice['id'], choice['votes'])
+             for choice in response.context['choices']],
+            [(first.pk, 2), (second.pk, 1)])
+        self.assertContains(response, "Choice 0 - 2 (66.7%)")
+        self.assertContains(response, "Choice 1 - 1 (33.3%)")
+        self.assertContains(response, 'Total votes: <span id="total-votes">3</span>')
+
+    def test_no_votes(self):
+        """
+        A poll without votes shows 0% for every choice.
+        """
+        question = create_poll(2)
+        response = self.client.get(reverse('polls:results', args=(question.id,)))
+        self.assertContains(response, "Choice 0 - 0 (0.0%)")
+        self.assertContains(response, 'Total votes: <span id="total-votes">0</span>')
+
+    def test_query_count_is_constant(self):
+        """
+        Rendering uncached results takes the same number of queries for polls
+        with 2, 50 and 500 choices.
+        """
+        for num_choices in (2, 50, 500):
+            with self.subTest(num_choices=num_choices):
+                question = create_poll(num_choices)
+                url = reverse('polls:results', args=(question.id,))
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context['choices']), num_choices)
+
+
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_poll(2)
+        self.choice = self.question.choice_set.first()
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_cached_results_skip_tally_query(self):
+        """
+        A second view of the results is served from the cache.
+        """
+        # Logged in, so that the page itself is not cached.
+        self.client.force_login(User.objects.create_user(username='viewer'))
+        self.client.get(self.url)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+    def test_vote_invalidates_results(self):
+        """
+        Recording a vote makes the cached results stale.
+        """
+        self.client.get(self.url)
+        user = User.objects.create_user(username='voter')
+        Vote.objects.record(user, self.choice)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['total_votes'], 1)
+
+    def test_choice_edit_invalidates_results(self):
+        """
+        Editing a choice, e.g. in the admin, makes the cached results stale.
+        """
+        self.client.get(self.url)
+        self.choice.choice_text = "Renamed choice"
+        self.choice.save()
+        self.assertContains(self.client.get(self.url), "Renamed choice")
+
+    def test_hit_and_miss_counts(self):
+        """
+        Staff can see the hit and miss counts of the results cache.
+        """
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get(reverse('polls:cache_stats'))
+        self.assertEqual(response.json(),
+                         {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_hit_and_miss_counts_are_staff_only(self):
+        """
+        Users who are not staff cannot see the cache statistics.
+        """
+        response = self.client.get(reverse('polls:cache_stats'))
+        self.assertEqual(response.status_code, 302)
+
+
+class FinalResultsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_poll(2)
+        self.choice = self.question.choice_set.order_by('pk').first()
+        for i in range(2):
+            Vote.objects.create(
+                user=User.objects.create_user(username=f'user{i}'),
+                choice=self.choice)
+        self.question.end_date = timezone.now() - datetime.timedelta(hours=1)
+        self.question.save()
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_closed_poll_results_are_frozen(self):
+        """
+        The first view of a closed poll's results takes a snapshot, which
+        later views show without counting votes.
+        """
+        self.client.get(self.url)
+        self.assertEqual(ResultsSnapshot.objects.get().total_votes, 2)
+        Vote.objects.create(user=User.objects.create_user(username='late'),
+                            choice=self.choice)
+        cache.clear()
+        with self.assertNumQueries(2):
+            # The question and the snapshot.
+            response = self.client.get(self.url)
+        self.assertContains(response, "Choice 0 - 2 (100.0%)")
+        self.assertNotContains(response, "EventSource")
+
+    def test_far_future_cache_headers(self):
+        """
+        Anonymous visitors may keep a closed poll's results for long.
+        """
+        response = self.client.get(self.url)
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_finalize_polls_archives_votes(self):
+        """
+        finalize_polls takes the snapshots of closed polls and moves their
+        votes to the archive, leaving the results unchanged.
+        """
+        open_poll = create_poll(1)
+        Vote.objects.create(user=User.objects.get(username='user0'),
+                            choice=open_poll.choice_set.get())
+        call_command('finalize_polls', '--archive-votes',
+                     stdout=io.StringIO())
+        self.assertEqual(ResultsSnapshot.objects.get().question,
+                         self.question)
+        self.assertEqual(ArchivedVote.objects.count(), 2)
+        self.assertEqual(list(Vote.objects.values_list('question', flat=True)),
+                         [open_poll.pk])
+        self.assertContains(self.client.get(self.url),
+                            'Total votes: <span id="total-votes">2</span>')
+
+    def test_reopening_drops_snapshot(self):
+        """
+        A closed poll that is reopened is counted live again.
+        """
+        self.client.get(self.url)
+        self.question.end_date = None
+        self.question.save()
+        self.assertFalse(ResultsSnapshot.objects.exists())
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['final'])
+        self.assertNotIn('max-age', response.get('Cache-Control', ''))
+
+    def test_reopening_restores_archived_votes(self):
+        """
+        Reopening a poll whose votes were archived moves them back, so they
+        are counted and their users cannot vote a second time.
+        """
+        call_command('finalize_polls', '--archive-votes',
+                     stdout=io.StringIO())
+        self.question.end_date = None
+        self.question.save()
+        self.assertFalse(ArchivedVote.objects.exists())
+        self.assertContains(self.client.get(self.url),
+                            'Total votes: <span id="total-votes">2</span>')
+        user = User.objects.get(username='user0')
+        second = self.question.choice_set.order_by('pk').last()
+        self.assertEqual(Vote.objects.record(user, second), self.choice.pk)
+        self.assertEqual(self.question.total_votes, 2)
+
+    def test_results_are_frozen_after_grace_period(self):
+        """
+        Votes written shortly after the end date, having been accepted
+        before it, are still counted.
+        """
+        self.question.end_date = timezone.now() - datetime.timedelta(seconds=5)
+        self.question.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['final'])
+        self.assertFalse(ResultsSnapshot.objects.exists())
+        Vote.objects.create(user=User.objects.create_user(username='late'),
+                            choice=self.choice)
+        with override_settings(POLLS_FINAL_RESULTS_GRACE=1):
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['final'])
+        self.assertEqual(ResultsSnapshot.objects.get().total_votes, 3)
+
+    @override_settings(POLLS_VOTE_INGESTION='queue')
+    def test_snapshot_writes_queued_votes(self):
+        """
+        Votes still waiting in the write-behind queue are written before
+        the snapshot is taken.
+        """
+        queue = VoteQueue(flush_interval=3600, batch_size=1000)
+        self.addCleanup(queue.stop)
+        late = User.objects.create_user(username='late')
+        with mock.patch('polls.ingest._vote_queue', queue):
+            queue.submit(late.pk, self.question.pk, self.choice.pk)
+            self.client.get(self.url)
+        self.assertEqual(ResultsSnapshot.objects.get().total_votes, 3)
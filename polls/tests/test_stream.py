@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from polls import stream
+from polls.stream import ResultsBroadcaster, stream_results
+
+
+def make_results(*votes):
+    """Return results for choices 1, 2, ... with the given vote counts."""
+    return {
+        'total_votes': sum(votes),
+        'choices': [{'id': i, 'choice_text': f"Choice {i}", 'votes': count,
+                     'percentage': 0}
+                    for i, count in enumerate(votes, start=1)],
+    }
+
+
+class ResultsBroadcasterTests(SimpleTestCase):
+    def setUp(self):
+        self.question = SimpleNamespace(pk=1)
+        self.results = make_results(0, 0)
+        self.version = 'v1'
+        self.loads = 0
+
+        def get_results(question):
+            self.loads += 1
+            return self.results
+
+        for name, replacement in (('get_results', get_results),
+                                  ('results_version', lambda pk: self.version)):
+            patcher = mock.patch.object(stream, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_broadcaster(self, queue_size=16):
+        broadcaster = ResultsBroadcaster(self.question, poll_interval=3600,
+                                         queue_size=queue_size)
+        # Refresh only when a test asks, not from the background task.
+        broadcaster._run = mock.AsyncMock()
+        return broadcaster
+
+    async def test_one_load_for_many_subscribers(self):
+        """
+        All subscribers get the same events from a single results load.
+        """
+        broadcaster = self.make_broadcaster()
+        queues = [broadcaster.subscribe() for _ in range(100)]
+        await broadcaster.refresh()
+        self.results, self.version = make_results(1, 0), 'v2'
+        await broadcaster.refresh()
+        self.assertEqual(self.loads, 2)
+        for queue in queues:
+            self.assertEqual(queue.get_nowait(), ('snapshot', make_results(0, 0)))
+            self.assertEqual(queue.get_nowait(),
+                             ('delta', {'total_votes': 1, 'choices': {1: 1}}))
+        broadcaster.subscribers.clear()
+
+    async def test_unchanged_version_skips_load(self):
+        """
+        The results are not reloaded while their version stays the same.
+        """
+        broadcaster = self.make_broadcaster()
+        queue = broadcaster.subscribe()
+        await broadcaster.refresh()
+        await broadcaster.refresh()
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(queue.qsize(), 1)
+        broadcaster.unsubscribe(queue)
+
+    async def test_slow_subscriber_gets_snapshot(self):
+        """
+        A subscriber whose queue is full is resynchronised with a snapshot
+        instead of blocking the broadcaster.
+        """
+        broadcaster = self.make_broadcaster(queue_size=2)
+        queue = broadcaster.subscribe()
+        for count in range(5):
+            self.results, self.version = make_results(count, 0), f'v{count}'
+            await broadcaster.refresh()
+        self.assertEqual(queue.get_nowait(), ('snapshot', make_results(4, 0)))
+        self.assertTrue(queue.empty())
+        broadcaster.unsubscribe(queue)
+
+    @override_settings(POLLS_STREAM_POLL_INTERVAL=0.01,
+                       POLLS_STREAM_HEARTBEAT=0.01, POLLS_STREAM_MAX_AGE=0.05)
+    async def test_stream_ends_and_cleans_up(self):
+        """
+        A stream sends its events and keep-alives, ends at its maximum age,
+        and the broadcaster goes away with its last subscriber.
+        """
+        chunks = [chunk async for chunk in stream_results(self.question)]
+        self.assertEqual(chunks[0], "retry: 3000\n\n")
+        self.assertIn('event: snapshot\ndata: {"total_votes": 0', chunks[1])
+        self.assertIn(": keep-alive\n\n", chunks)
+        # Let the producer notice that nobody is listening any more.
+        await asyncio.sleep(0.05)
+        self.assertNotIn(self.question.pk, stream._broadcasters)
@@ -1,10 +1,17 @@
 import datetime
+import io
+import threading
+import time
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
-from polls.models import Question, Choice, Vote
+from polls.cache import voted_choices
+from polls.models import Question, Choice, Vote, VoteCounter
 
 def create_question(question_text, days):
     """
@@ -50,3 +57,272 @@ class VoteModelTests(TestCase):
 
         self.assertEqual(vote1.choice, choice1)
         self.assertEqual(vote2.choice, choice2)
+
+    def test_one_vote_per_user_per_question(self):
+        """
+        The database rejects a second vote by the same user in the same poll.
+        """
+        question = create_question(question_text="Test question.", days=-1)
+        choice1 = Choice.objects.create(question=question,
+                                        choice_text="Test choice 1.")
+        choice2 = Choice.objects.create(question=question,
+                                        choice_text="Test choice 2.")
+        user = User.objects.create_user(username='user', password='password')
+
+        vote = Vote.objects.create(choice=choice1, user=user)
+        self.assertEqual(vote.question, question)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(choice=choice2, user=user)
+
+
+class VoteCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Counted question.",
+                                        days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 1.")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Choice 2.")
+        self.user = User.objects.create_user(username='voter',
+                                             password='password')
+        self.client.force_login(self.user)
+
+    def vote_for(self, choice):
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                                {'choice': choice.id})
+
+    def assertVoteCounts(self, total, first, second):
+        self.assertEqual(self.question.total_votes, total)
+        self.assertEqual(self.choice1.votes, first)
+        self.assertEqual(self.choice2.votes, second)
+
+    def test_vote_increments_counters(self):
+        """
+        A new vote increments the choice's and the question's vote counts.
+        """
+        self.vote_for(self.choice1)
+        self.assertVoteCounts(total=1, first=1, second=0)
+
+    def test_changed_vote_moves_count(self):
+        """
+        Changing a vote moves the count from the old choice to the new one
+        without changing the question's total.
+        """
+        self.vote_for(self.choice1)
+        self.vote_for(self.choice2)
+        self.assertVoteCounts(total=1, first=0, second=1)
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 1)
+
+    def test_repeated_vote_does_not_count_twice(self):
+        """
+        Voting again for the same choice leaves the counts unchanged.
+        """
+        self.vote_for(self.choice1)
+        self.vote_for(self.choice1)
+        self.assertVoteCounts(total=1, first=1, second=0)
+
+    def test_vote_is_written_in_one_statement(self):
+        """
+        A changed vote is written with one upsert, which returns the replaced
+        choice, followed by the counter updates; a repeated vote only runs
+        the upsert.
+        """
+        Vote.objects.record(self.user, self.choice1)
+        with CaptureQueriesContext(connection) as queries:
+            previous = Vote.objects.record(self.user, self.choice2)
+        self.assertEqual(previous, self.choice1.pk)
+        statements = [query['sql'] for query in queries
+                      if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[0].startswith('INSERT INTO "polls_vote"'))
+        with CaptureQueriesContext(connection) as queries:
+            previous = Vote.objects.record(self.user, self.choice2)
+        self.assertEqual(previous, self.choice2.pk)
+        self.assertEqual(len([query for query in queries
+                              if 'SAVEPOINT' not in query['sql']]), 1)
+        self.assertVoteCounts(total=1, first=0, second=1)
+
+    def test_rebuild_vote_counts(self):
+        """
+        rebuild_vote_counts recomputes the counters from Vote rows.
+        """
+        other = User.objects.create_user(username='other', password='password')
+        # Bulk writes, like fixtures, bypass the counters.
+        Vote.objects.bulk_create([
+            Vote(user=self.user, question=self.question, choice=self.choice1),
+            Vote(user=other, question=self.question, choice=self.choice2),
+        ])
+        self.assertVoteCounts(total=0, first=0, second=0)
+        call_command('rebuild_vote_counts', stdout=io.StringIO())
+        self.assertVoteCounts(total=2, first=1, second=1)
+
+    def test_saved_and_deleted_votes_are_counted(self):
+        """
+        Votes created or deleted directly, rather than recorded, update
+        the counters too.
+        """
+        other = User.objects.create_user(username='other', password='password')
+        vote = Vote.objects.create(user=self.user, choice=self.choice1)
+        Vote.objects.create(user=other, choice=self.choice2)
+        self.assertVoteCounts(total=2, first=1, second=1)
+        vote.delete()
+        other.delete()
+        self.assertVoteCounts(total=0, first=0, second=0)
+
+    def test_votes_are_spread_over_shards(self):
+        """
+        Votes by different users for the same choice are added to different
+        shards, and the choice's votes are their sum.
+        """
+        users = [User.objects.create_user(username=f'user{i}')
+                 for i in range(3)]
+        with override_settings(POLLS_VOTE_COUNTER_SHARDS=4):
+            for user in users:
+                Vote.objects.record(user, self.choice1)
+        self.assertEqual(
+            VoteCounter.objects.filter(choice=self.choice1).count(), 3)
+        self.assertVoteCounts(total=3, first=3, second=0)
+
+    def test_compaction_keeps_totals(self):
+        """
+        compact_vote_counters moves the shard counts into the choices' and
+        questions' vote_count without changing the totals.
+        """
+        self.vote_for(self.choice1)
+        self.vote_for(self.choice2)
+        call_command('compact_vote_counters', stdout=io.StringIO())
+        self.assertFalse(VoteCounter.objects.exclude(count=0).exists())
+        self.question.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.question.vote_count, self.choice2.vote_count),
+                         (1, 1))
+        self.assertVoteCounts(total=1, first=0, second=1)
+        self.vote_for(self.choice1)
+        self.assertVoteCounts(total=1, first=1, second=0)
+
+
+class VoteSessionTests(TestCase):
+    def test_vote_does_not_write_session(self):
+        """
+        The message shown after a vote travels in a cookie, so voting does
+        not save the session.
+        """
+        question = create_question(question_text="Session question.", days=-1)
+        choice = Choice.objects.create(question=question,
+                                       choice_text="Choice 1.")
+        self.client.force_login(User.objects.create_user(username='voter'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('polls:vote', args=(question.id,)),
+                {'choice': choice.id})
+        self.assertIn('messages', response.cookies)
+        self.assertEqual(
+            [query['sql'] for query in queries
+             if 'django_session' in query['sql']
+             and not query['sql'].startswith('SELECT')], [])
+
+
+class VotedChoicesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='voter',
+                                             password='password')
+        self.questions = [create_question(question_text=f"Question {i}.",
+                                          days=-1) for i in range(3)]
+        self.choices = [Choice.objects.create(question=question,
+                                              choice_text="Choice.")
+                        for question in self.questions]
+
+    def test_vote_updates_cached_map(self):
+        """
+        Recording a vote updates the user's cached map, so reading it again
+        needs no query.
+        """
+        self.assertEqual(voted_choices(self.user.pk), {})
+        Vote.objects.record(self.user, self.choices[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(voted_choices(self.user.pk),
+                             {self.questions[0].pk: self.choices[0].pk})
+
+    def test_saved_vote_makes_map_stale(self):
+        """
+        Votes saved other than through record() are picked up as well.
+        """
+        voted_choices(self.user.pk)
+        Vote.objects.create(user=self.user, choice=self.choices[1])
+        self.assertEqual(voted_choices(self.user.pk),
+                         {self.questions[1].pk: self.choices[1].pk})
+
+    def test_index_marks_voted_polls(self):
+        """
+        The index marks the polls the user voted in, whatever their number,
+        without a query per poll.
+        """
+        self.client.force_login(self.user)
+        self.client.get(reverse('polls:index'))
+        for choice in self.choices[:2]:
+            Vote.objects.record(self.user, choice)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.context['voted_question_ids'],
+                         {question.pk for question in self.questions[:2]})
+        self.assertContains(response, "You voted", count=2)
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    # How often a vote is tried while sqlite reports the database locked.
+    vote_attempts = 50
+
+    def test_concurrent_votes_keep_one_vote_per_user(self):
+        """
+        Many threads voting at once as the same users leave exactly one vote
+        per user in the poll, and counters that agree with the Vote rows.
+        """
+        question = create_question(question_text="Busy question.", days=-1)
+        choices = [Choice.objects.create(question=question,
+                                         choice_text=f"Choice {i}.")
+                   for i in range(3)]
+        users = [User.objects.create_user(username=f'user{i}')
+                 for i in range(4)]
+        barrier = threading.Barrier(12)
+        errors = []
+
+        def cast_votes(thread_number):
+            barrier.wait()
+            try:
+                for attempt in range(10):
+                    user = users[(thread_number + attempt) % len(users)]
+                    choice = choices[(thread_number * attempt) % len(choices)]
+                    for retry in range(self.vote_attempts):
+                        try:
+                            Vote.objects.record(user, choice)
+                            break
+                        except OperationalError:
+                            # sqlite reports lock contention as an error
+                            # instead of waiting; retry like a client would,
+                            # but fail rather than hang on a lasting error.
+                            if retry == self.vote_attempts - 1:
+                                raise
+                            time.sleep(0.05)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=cast_votes, args=(i,))
+                   for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Vote.objects.filter(question=question).count(),
+                         len(users))
+        for user in users:
+            self.assertEqual(
+                Vote.objects.filter(question=question, user=user).count(), 1)
+        self.assertEqual(question.total_votes, len(users))
+        for choice in choices:
+            self.assertEqual(choice.votes, choice.vote_set.count())
@@ -2,11 +2,25 @@ from django.urls import path
 from django.views.generic.base import RedirectView
 
 from . import views
+from .pagecache import cache_anonymous_page, index_version, results_page_version
 
 app_name = "polls"
 urlpatterns = [
-    path("", views.IndexView.as_view(), name="index"),
+    # The page cache wraps the whole view, as method_decorator cannot wrap
+    # async methods on every supported Django version.
+    path("", cache_anonymous_page(index_version)(views.IndexView.as_view()),
+         name="index"),
     path("<int:pk>/", views.DetailView.as_view(), name="detail"),
-    path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
+    path("<int:pk>/results/",
+         cache_anonymous_page(results_page_version)(
+             views.ResultsView.as_view()),
+         name="results"),
+    path("<int:pk>/results/stream/", views.results_stream,
+         name="results_stream"),
+    path("<int:pk>/results.csv", views.results_export, {"format": "csv"},
+         name="results_csv"),
+    path("<int:pk>/results.jsonl", views.results_export, {"format": "jsonl"},
+         name="results_jsonl"),
     path("<int:question_id>/vote/", views.vote, name="vote"),
+    path("cache-stats/", views.cache_stats, name="cache_stats"),
 ]
\ No newline at end of file
@@ -1,14 +1,32 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, HttpResponseRedirect,
+                         JsonResponse, StreamingHttpResponse)
 from django.urls import reverse
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, aget_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.utils.cache import patch_cache_control
 from django.views import generic
 from django.utils import timezone
+from .cache import get_results, results_cache_stats, voted_choices
+from .export import (CHOICE_FIELDS, CONTENT_TYPES, EXPORT_CHUNK_SIZE,
+                     VOTE_FIELDS, aexport_lines, choice_rows, export_lines,
+                     vote_rows)
+from .ingest import add_pending_vote, get_vote_queue, queue_enabled
 from .models import Choice, Question, Vote
+from .ratelimit import client_ip, rate_limit
+from .routers import stick_to_primary
+from .stream import can_stream, stream_results
 from django.contrib.auth import authenticate, login as auth_login
 from django.contrib.auth import logout as auth_logout
+import datetime
 import logging
 
 
@@ -17,19 +35,80 @@ import logging
 
 class IndexView(generic.ListView):
     """
-    The IndexView class is a generic ListView that displays a list of the
-    latest five published questions. It uses the “polls/index.html” template
-    to render the index page.
+    The IndexView class is a generic ListView that displays a page of the
+    latest published questions, newest first. Pages are selected with a
+    keyset cursor on (pub_date, id) rather than an offset, so later pages are
+    as cheap to fetch as the first one. It uses the “polls/index.html”
+    template to render the index page.
     """
     template_name = "polls/index.html"
     context_object_name = "latest_question_list"
+    page_size = 20
+    cursor_param = "after"
+
+    async def get(self, request, *args, **kwargs):
+        user = await load_user(request)
+        # Fetch one extra row to find out whether there is a next page.
+        questions = [question async for question in
+                     self.get_queryset()[:self.page_size + 1]]
+        self.next_cursor = None
+        if len(questions) > self.page_size:
+            questions = questions[:self.page_size]
+            self.next_cursor = encode_cursor(questions[-1])
+        self.object_list = questions
+        self.voted_question_ids = set()
+        if user.is_authenticated:
+            self.voted_question_ids = await get_voted_question_ids(
+                user, questions)
+        return self.render_to_response(self.get_context_data())
 
     def get_queryset(self):
         """
-        Return the last five published questions (not including those set to be
-        published in the future).
+        Return the published questions (not including those set to be
+        published in the future) that come after the cursor in the query
+        string, newest first and each annotated with `is_open`.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by("-pub_date")
+        now = timezone.now()
+        queryset = (
+            Question.objects.published(now).with_status(now)
+            .order_by("-pub_date", "-id")
+        )
+        cursor = decode_cursor(self.request.GET.get(self.cursor_param))
+        if cursor:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.next_cursor
+        context["cursor_param"] = self.cursor_param
+        context["voted_question_ids"] = self.voted_question_ids
+        return context
+
+
+def encode_cursor(question):
+    """Return the index page cursor that points just past `question`."""
+    return f"{question.pub_date.isoformat()}_{question.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Return the (pub_date, id) pair encoded in an index page cursor, or None
+    if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    pub_date, _, pk = cursor.rpartition("_")
+    try:
+        pub_date = datetime.datetime.fromisoformat(pub_date)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if timezone.is_naive(pub_date):
+        return None
+    return pub_date, pk
 
 
 class DetailView(generic.DetailView):
@@ -42,99 +121,264 @@ class DetailView(generic.DetailView):
     model = Question
     template_name = "polls/detail.html"
 
-    def get(self, request, *args, **kwargs):
-        # First, retrieve the object by calling the parent class's get method
-        self.object = self.get_object()
-        question = self.object  # Now, 'question' is the retrieved object
+    async def get(self, request, *args, **kwargs):
+        user = await load_user(request)
+        self.object = await aget_object_or_404(Question, pk=kwargs["pk"])
+        question = self.object
+        now = timezone.now()
 
         # Check if the poll is published
-        if not question.is_published():
+        if not question.is_published(now):
             messages.error(request, "This poll is not yet published.")
             return redirect('polls:index')
 
         # Check if voting is allowed for the poll
-        if not question.can_vote():
+        if not question.can_vote(now):
             messages.error(request, "Voting is not allowed for this poll.")
             return redirect('polls:index')
 
         # Attempt to retrieve the user's previous vote if authenticated
         user_vote = None
-        if request.user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=request.user, choice__question=question).choice.id
-            except Vote.DoesNotExist:
-                user_vote = None
+        if user.is_authenticated and queue_enabled():
+            user_vote = get_vote_queue().pending_choice(user.pk, question.pk)
+        if user.is_authenticated and user_vote is None:
+            voted = await sync_to_async(voted_choices)(user.pk)
+            user_vote = voted.get(question.pk)
 
         # Call super().get_context_data() to properly initialize context
-        context = self.get_context_data(object=question, user_vote=user_vote)
+        context = self.get_context_data(object=question,
+                                        choices=await get_choices(question),
+                                        user_vote=user_vote)
         return self.render_to_response(context)
 
 
+async def load_user(request):
+    """
+    Return the user of the request, loaded without blocking the event loop.
+    The user is also stored as request.user so that templates do not load it
+    a second time.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+async def get_voted_question_ids(user, questions):
+    """Return the ids of the `questions` that `user` voted in."""
+    voted = await sync_to_async(voted_choices)(user.pk)
+    ids = {question.pk for question in questions if question.pk in voted}
+    if queue_enabled():
+        queue = get_vote_queue()
+        ids.update(question.pk for question in questions
+                   if queue.pending_choice(user.pk, question.pk) is not None)
+    return ids
+
+
+async def get_choices(question):
+    """
+    Return the choices of `question` as a list. They are selected through
+    Choice.objects rather than question.choice_set: under WSGI, the related
+    manager leaves one more context variable behind in the worker thread on
+    every request, which makes each later request slower.
+    """
+    return [choice async for choice in
+            Choice.objects.filter(question_id=question.pk)]
+
+
 logger = logging.getLogger('polls')
 
 
 class ResultsView(generic.DetailView):
     """
     The ResultsView class is another generic DetailView, displaying the
-    results of a specific Question instance. The template used here is
-    “polls/results.html”.
+    results of a specific Question instance. The vote tallies come from the
+    results cache and are computed in one annotated query on a miss, so the
+    page costs the same number of queries however many choices the poll has.
+    Closed polls are shown from their frozen results snapshot once their
+    grace period is over (see Question.is_final()), and their pages for
+    anonymous visitors may then be cached for POLLS_FINAL_RESULTS_MAX_AGE.
+    The template used here is “polls/results.html”.
     """
     model = Question
     template_name = "polls/results.html"
 
+    async def get(self, request, *args, **kwargs):
+        user = await load_user(request)
+        self.object = await aget_object_or_404(Question, pk=kwargs["pk"])
+        # The cache lookup and a possible rebuild run in one thread hop.
+        results = await sync_to_async(get_results)(self.object)
+        final = self.object.is_final()
+        if user.is_authenticated and queue_enabled() and not final:
+            results = await add_own_pending_vote(results, user, self.object)
+        context = self.get_context_data(object=self.object,
+                                        choices=results["choices"],
+                                        total_votes=results["total_votes"],
+                                        final=final,
+                                        live=not final and can_stream(request))
+        response = self.render_to_response(context)
+        # Pages of logged-in users carry a CSRF token, which must not be
+        # kept for long.
+        if final and not user.is_authenticated:
+            patch_cache_control(response, public=True, immutable=True,
+                                max_age=settings.POLLS_FINAL_RESULTS_MAX_AGE)
+        return response
 
+
+async def add_own_pending_vote(results, user, question):
+    """
+    Return `results` counting the vote of `user` in `question` that still
+    waits in the write-behind queue, if any, so that voters see their vote
+    without waiting for the next flush.
+    """
+    choice_id = get_vote_queue().pending_choice(user.pk, question.pk)
+    if choice_id is None:
+        return results
+    voted = await sync_to_async(voted_choices)(user.pk)
+    return add_pending_vote(results, voted.get(question.pk), choice_id)
+
+
+async def results_stream(request, pk):
+    """
+    Stream the results of a question as server-sent events: a snapshot of
+    all choices first, then the changed counts whenever votes come in.
+    The stream is only served through ASGI (mysite/asgi.py); under WSGI the
+    response is 204 No Content, which tells browsers not to reconnect.
+    """
+    if not can_stream(request):
+        return HttpResponse(status=204)
+    question = await aget_object_or_404(Question, pk=pk)
+    return StreamingHttpResponse(
+        stream_results(question),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def results_export(request, pk, format):
+    """
+    Return the results of a question as CSV or JSON Lines, one row per
+    choice. With `votes` in the query string, staff get a streamed dump of
+    the individual votes instead, starting after the vote id given as
+    `after` so that an interrupted download can be resumed. The dump is read
+    with an async iterator through ASGI and a sync one through WSGI, where
+    Django would collect an async iterator into a list first.
+    """
+    question = await aget_object_or_404(Question, pk=pk)
+    if "votes" not in request.GET:
+        results = await sync_to_async(get_results)(question)
+        response = HttpResponse(
+            "".join(export_lines(choice_rows(results), CHOICE_FIELDS, format)),
+            content_type=CONTENT_TYPES[format],
+        )
+        filename = f"poll-{question.pk}-results.{format}"
+    else:
+        user = await load_user(request)
+        if not user.is_staff:
+            return HttpResponseForbidden("Only staff can export votes.")
+        try:
+            after = int(request.GET.get("after", 0))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid cursor.")
+        votes = vote_rows([question.pk], after)
+        if isinstance(request, ASGIRequest):
+            lines = aexport_lines(
+                votes.aiterator(chunk_size=EXPORT_CHUNK_SIZE),
+                VOTE_FIELDS, format)
+        else:
+            lines = export_lines(votes.iterator(chunk_size=EXPORT_CHUNK_SIZE),
+                                 VOTE_FIELDS, format)
+        response = StreamingHttpResponse(
+            lines, content_type=CONTENT_TYPES[format])
+        filename = f"poll-{question.pk}-votes.{format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def cache_stats(request):
+    """Return the hit and miss counts of the results cache as JSON."""
+    return JsonResponse(results_cache_stats())
+
+
+@rate_limit('vote')
 @login_required
-def vote(request, question_id):
+async def vote(request, question_id):
     """
     The vote function handles voting on a particular question. It first fetches
     the question based on the provided ID. If no valid choice is submitted in
     the POST request, it returns an error message to the user and redisplays
-    the detail page. Otherwise, it increments the vote count for that chosen
-    option, saves it, and redirects the user to the results page of the
-    question they just voted on.
+    the detail page. Otherwise, it records the user's vote for that chosen
+    option, updates the stored vote counts, and redirects the user to the
+    results page of the question they just voted on. A vote for the choice
+    the user already voted for is not written again. This is decided inside
+    the vote's transaction, because another process's cached vote map may be
+    stale. Clients that vote too often get a 429 response (see
+    polls/ratelimit.py).
     """
-    question = get_object_or_404(Question, pk=question_id)
+    this_user = await load_user(request)
+    question = await aget_object_or_404(Question, pk=question_id)
 
     if not question.can_vote():
-        logger.warning(f"User {request.user.username} attempted to vote in a closed poll {question_id}")
-        return render(request, 'polls/detail.html', {
+        logger.warning("User %s attempted to vote in a closed poll %s",
+                       this_user.username, question_id)
+        return TemplateResponse(request, 'polls/detail.html', {
             'question': question,
+            'choices': await get_choices(question),
             'error_message': "You cannot vote in this poll."
         })
 
     try:
-        selected_choice = question.choice_set.get(pk=request.POST["choice"])
-    except (KeyError, Choice.DoesNotExist):
-        logger.warning(f"User {request.user.username} failed to select a choice for question {question_id}")
+        selected_choice = await Choice.objects.aget(
+            pk=request.POST["choice"], question_id=question.pk)
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        logger.warning("User %s failed to select a choice for question %s",
+                       this_user.username, question_id)
         # Redisplay the question voting form.
-        return render(
+        return TemplateResponse(
             request,
             "polls/detail.html",
             {
                 "question": question,
+                "choices": await get_choices(question),
                 "error_message": "You didn't select a choice.",
             },
         )
 
-    this_user = request.user
-    try:
-        # Check if the user already has a vote
-        vote = Vote.objects.get(user=this_user, choice__question=question)
-        # If they do, update their vote
-        vote.choice = selected_choice
-        vote.save()
-        logger.info(f"User {this_user.username} changed their vote to choice {selected_choice.choice_text} for question {question_id}")
+    if queue_enabled():
+        get_vote_queue().submit(this_user.pk, question.pk, selected_choice.pk)
+        logger.info("User %s queued a vote for choice %s for question %s",
+                    this_user.username, selected_choice.choice_text,
+                    question_id)
+        messages.success(request, f"You voted for '{selected_choice.choice_text}'")
+        return stick_to_primary(HttpResponseRedirect(
+            reverse("polls:results", args=(question.id,))))
+
+    # The vote is written in a transaction, which needs a synchronous thread.
+    previous_choice_id = await sync_to_async(Vote.objects.record)(
+        this_user, selected_choice)
+    if previous_choice_id == selected_choice.pk:
+        logger.info("User %s repeated their vote for choice %s for question %s",
+                    this_user.username, selected_choice.choice_text,
+                    question_id)
+        messages.info(request, f"You already voted for '{selected_choice.choice_text}'")
+        return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+    if previous_choice_id is not None:
+        logger.info("User %s changed their vote to choice %s for question %s",
+                    this_user.username, selected_choice.choice_text,
+                    question_id)
         messages.success(request, f"Your vote was updated to '{selected_choice.choice_text}'")
-    except Vote.DoesNotExist:
-        # If they don't have a vote yet, create a new one
-        vote = Vote.objects.create(user=this_user, choice=selected_choice)
-        logger.info(f"User {this_user.username} voted for choice {selected_choice.choice_text} for question {question_id}")
+    else:
+        logger.info("User %s voted for choice %s for question %s",
+                    this_user.username, selected_choice.choice_text,
+                    question_id)
         messages.success(request, f"You voted for '{selected_choice.choice_text}'")
 
-    # Redirect to the results page
-    return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+    # Redirect to the results page, read from the primary database so that
+    # it includes the vote.
+    return stick_to_primary(HttpResponseRedirect(
+        reverse("polls:results", args=(question.id,))))
 
 
+@rate_limit('login')
 def login(request):
     """
     Handle user login.
@@ -145,12 +389,12 @@ def login(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             auth_login(request, user)
-            ip_addr = request.META.get('REMOTE_ADDR')
-            logger.info(f"User {username} logged in from {ip_addr}")
+            ip_addr = client_ip(request)
+            logger.info("User %s logged in from %s", username, ip_addr)
             return redirect('polls:index')
         else:
-            ip_addr = request.META.get('REMOTE_ADDR')
-            logger.warning(f"Failed login attempt for {username} from {ip_addr}")
+            ip_addr = client_ip(request)
+            logger.warning("Failed login attempt for %s from %s", username, ip_addr)
     return render(request, 'login.html')
 
 
@@ -158,7 +402,7 @@ def logout(request):
     """
     Handle user logout.
     """
-    ip_addr = request.META.get('REMOTE_ADDR')
-    logger.info(f"User {request.user.username} logged out from {ip_addr}")
+    ip_addr = client_ip(request)
+    logger.info("User %s logged out from %s", request.user.username, ip_addr)
     auth_logout(request)
     return redirect('polls:index')